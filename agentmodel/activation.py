@@ -0,0 +1,72 @@
+import heapq
+
+from mesa.time import BaseScheduler
+
+
+class ActiveSetActivation(BaseScheduler):
+    """ RandomActivation that only steps agents with something to do.
+
+    Agents passed to activate() step every tick, e.g. because of their role.
+    Other agents step only in ticks they were woken for with wake(), e.g.
+    because content arrived for them, and are skipped otherwise.
+
+    The agents that step do so in random order: each gets a random
+    activation time in [0, 1) per tick and they step in order of those
+    times. An agent woken during a tick steps later in the same tick if its
+    time has not passed yet and in the next tick otherwise, which is what
+    happens under RandomActivation to an agent handed work by an agent that
+    steps before or after it.
+    """
+
+    def __init__(self, model):
+        super().__init__(model)
+        # unique_ids of the agents that step every tick, and of the agents
+        # woken for the next tick
+        self._active = set()
+        self._woken = set()
+        self._times = {}
+        self._queue = []
+        # Activation time of the agent stepping, None between ticks
+        self._now = None
+
+    def remove(self, agent):
+        super().remove(agent)
+        self._active.discard(agent.unique_id)
+        self._woken.discard(agent.unique_id)
+
+    def activate(self, agent):
+        """ Step agent every tick from now on. """
+        self._active.add(agent.unique_id)
+
+    def wake(self, agent):
+        """ Step agent once, in this tick if its turn is still to come. """
+        key = agent.unique_id
+        if self._now is not None:
+            time = self._times.get(key)
+            if time is None:
+                time = self._times[key] = self.model.random.random()
+                if time > self._now:
+                    heapq.heappush(self._queue, (time, key))
+                    return
+            elif time > self._now:
+                # Already waiting for its turn in this tick
+                return
+        self._woken.add(key)
+
+    def step(self):
+        # Times are drawn in unique_id order so that runs are reproducible
+        keys = sorted(self._active | self._woken)
+        self._woken = set()
+        self._times = {key: self.model.random.random() for key in keys}
+        self._queue = [(time, key) for key, time in self._times.items()]
+        heapq.heapify(self._queue)
+
+        self._now = 0.0
+        while self._queue:
+            self._now, key = heapq.heappop(self._queue)
+            agent = self._agents.get(key)
+            if agent is not None:
+                agent.step()
+        self._now = None
+        self.steps += 1
+        self.time += 1
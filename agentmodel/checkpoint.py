@@ -0,0 +1,82 @@
+import json
+import os
+
+import numpy as np
+
+
+# Checkpoints are .npz files: a JSON header, plus named arrays for the RNG
+# states, the collected data and whatever agent state the model saves. The
+# graph is not stored; models rebuild it from their parameters, which hits
+# the on-disk graph cache.
+
+def pack_lists(lists):
+    """ Ragged lists of ints as one flat array and (len(lists) + 1) offsets. """
+    offsets = np.zeros(len(lists) + 1, dtype=np.int64)
+    np.cumsum([len(items) for items in lists], out=offsets[1:])
+    values = np.fromiter((item for items in lists for item in items), dtype=np.int64, count=offsets[-1])
+    return values, offsets
+
+
+def unpack_lists(values, offsets):
+    """ Inverse of pack_lists(), as lists of Python ints. """
+    values = values.tolist()
+    return [values[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+def _random_state(rng):
+    version, internal, gauss = rng.getstate()
+    return version, np.array(internal, dtype=np.uint32), gauss
+
+
+def _set_random_state(rng, version, internal, gauss):
+    rng.setstate((version, tuple(internal.tolist()), gauss))
+
+
+def write_checkpoint(path, model, state, arrays):
+    """ Save a model with its model-specific state (JSON) and arrays.
+
+    Besides those, the checkpoint holds model.params and the seed to rebuild
+    the model with, the schedule's step counter, model.random and the
+    collected data.
+    """
+    header = {"model": "{}.{}".format(type(model).__module__, type(model).__name__),
+              "params": model.params,
+              "seed": model._seed,
+              "steps": model.schedule.steps,
+              "time": model.schedule.time,
+              "running": model.running,
+              "state": state}
+    arrays = dict(arrays)
+
+    header["random_version"], arrays["random"], header["random_gauss"] = _random_state(model.random)
+    for name, array in model.datacollector.get_state().items():
+        arrays["collector/" + name] = array
+
+    arrays["header"] = np.frombuffer(json.dumps(header, default=lambda v: v.item()).encode(), dtype=np.uint8)
+    # Written next to the old checkpoint first, so an interrupted save
+    # leaves the previous one intact
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez_compressed(f, **arrays)
+    os.replace(tmp_path, path)
+
+
+def read_checkpoint(path):
+    """ The (header, arrays) of a checkpoint written by write_checkpoint(). """
+    with np.load(path) as data:
+        arrays = {name: data[name] for name in data.files}
+    header = json.loads(arrays.pop("header").tobytes().decode())
+    return header, arrays
+
+
+def restore_checkpoint(model, header, arrays):
+    """ Restore what write_checkpoint() saves for every model. """
+    model.schedule.steps = header["steps"]
+    model.schedule.time = header["time"]
+    model.running = header["running"]
+
+    _set_random_state(model.random, header["random_version"], arrays["random"], header["random_gauss"])
+
+    prefix = "collector/"
+    model.datacollector.set_state({name[len(prefix):]: array for name, array in arrays.items()
+                                   if name.startswith(prefix)})
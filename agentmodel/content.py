@@ -0,0 +1,70 @@
+from collections import Counter, deque
+
+import numpy as np
+import pandas as pd
+
+
+class ContentCatalog:
+    """ The content items of a model, with counters for what happened to each.
+
+    Every step generate() draws per_step ids in 1..max_content_id at once
+    from a NumPy generator. Items can be posted for `lifetime` steps,
+    including the one they were drawn in. Ids can be drawn again later and
+    then refer to the same item, as labels do.
+
+    reached, seen and blocked are Counters keyed by content id. They count
+    how often an item was delivered to an agent, seen by one, or blocked by
+    a label, so questions about single items need no scan over the agents.
+    Only the items drawn so far take memory, not the whole id range.
+    """
+
+    def __init__(self, rng, max_content_id=10000, per_step=10, lifetime=1):
+        self.rng = rng
+        self.max_content_id = max_content_id
+        self.per_step = per_step
+        self.lifetime = lifetime
+        self.reached = Counter()
+        self.seen = Counter()
+        self.blocked = Counter()
+        # Ids drawn in each of the last `lifetime` steps, oldest first
+        self._batches = deque(maxlen=lifetime)
+
+    def generate(self):
+        """ Draw this step's items. Returns the ids that can be posted now. """
+        self._batches.append(self.rng.integers(1, self.max_content_id + 1, self.per_step))
+        return self.live_ids()
+
+    def live_ids(self):
+        """ Ids of the items that can be posted, as a list of ints. """
+        if not self._batches:
+            return []
+        return np.concatenate(self._batches).tolist()
+
+    def escaped(self):
+        """ Ids of the items that were seen and never blocked. """
+        return np.array(sorted(item for item, count in self.seen.items()
+                               if count > 0 and not self.blocked[item]), dtype=np.int64)
+
+    def get_stats_dataframe(self):
+        """ Counters of the items that reached an agent, indexed by content id. """
+        ids = sorted(item for item, count in self.reached.items() if count)
+        return pd.DataFrame({"Reached": [self.reached[item] for item in ids],
+                             "Seen": [self.seen[item] for item in ids],
+                             "Blocked": [self.blocked[item] for item in ids]},
+                            index=pd.Index(ids, name="Content"))
+
+    def get_state(self):
+        """ Counters, as (content id, count) rows, and live batches as arrays, for checkpoints. """
+        state = {name: np.array(list(getattr(self, name).items()), dtype=np.int64).reshape(-1, 2)
+                 for name in ("reached", "seen", "blocked")}
+        state["batches"] = np.array(self._batches, dtype=np.int64).reshape(-1, self.per_step)
+        return state
+
+    def set_state(self, state):
+        """ Restore what get_state() returned. """
+        for name in ("reached", "seen", "blocked"):
+            counter = getattr(self, name)
+            counter.clear()
+            counter.update(dict(state[name].tolist()))
+        self._batches.clear()
+        self._batches.extend(state["batches"])
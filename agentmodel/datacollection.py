@@ -0,0 +1,148 @@
+import os
+
+import numpy as np
+import pandas as pd
+from mesa.datacollection import DataCollector
+
+
+class ColumnarDataCollector(DataCollector):
+    """ DataCollector that stores agent reporters as step x agent arrays.
+
+    Each agent reporter is written into a preallocated (chunk_steps x agents)
+    NumPy buffer instead of a tuple per agent per step. Full buffers become
+    chunks: .npy files under data_dir, loaded back memory-mapped, or plain
+    arrays kept in memory if data_dir is None. Model reporters and tables
+    work as in DataCollector.
+
+    The agent set must stay the same for the whole run, and each reporter's
+    dtype is taken from the first step it is collected at.
+    """
+
+    def __init__(self, model_reporters=None, agent_reporters=None, tables=None,
+                 data_dir=None, chunk_steps=100):
+        super().__init__(model_reporters, agent_reporters, tables)
+        self.data_dir = data_dir
+        self.chunk_steps = chunk_steps
+
+        self.agent_ids = None
+        self.steps = []
+        self._chunks = {name: [] for name in self.agent_reporters}
+        self._buffers = {}
+        self._buffered = 0
+
+        if data_dir is not None:
+            os.makedirs(data_dir, exist_ok=True)
+
+    def collect(self, model):
+        """ Collect all the data for the given model object. """
+        if self.model_reporters:
+            for var, reporter in self.model_reporters.items():
+                self.model_vars[var].append(reporter(model))
+
+        if self.agent_reporters:
+            self._record_agent_columns(model)
+
+    def _record_agent_columns(self, model):
+        agents = model.schedule.agents
+        if self.agent_ids is None:
+            self.agent_ids = np.array([agent.unique_id for agent in agents])
+        elif len(agents) != len(self.agent_ids):
+            raise ValueError("ColumnarDataCollector needs the same agents at every step")
+
+        for name, reporter in self.agent_reporters.items():
+            values = np.array([reporter(agent) for agent in agents])
+            if name not in self._buffers:
+                self._buffers[name] = np.empty((self.chunk_steps, len(agents)), dtype=values.dtype)
+            self._buffers[name][self._buffered] = values
+
+        self.steps.append(model.schedule.steps)
+        self._buffered += 1
+        if self._buffered == self.chunk_steps:
+            self.flush()
+
+    def _chunk_path(self, name, chunk):
+        return os.path.join(self.data_dir, "{}_{:05d}.npy".format(name.replace(" ", "_"), chunk))
+
+    def flush(self):
+        """ Turn the buffered steps into a chunk, written to disk if data_dir is set. """
+        if self._buffered == 0:
+            return
+
+        for name, buffer in self._buffers.items():
+            chunk = buffer[:self._buffered].copy()
+            if self.data_dir is not None:
+                path = self._chunk_path(name, len(self._chunks[name]))
+                np.save(path, chunk)
+                chunk = np.load(path, mmap_mode="r")
+            self._chunks[name].append(chunk)
+
+        if self.data_dir is not None:
+            np.save(os.path.join(self.data_dir, "steps.npy"), np.array(self.steps))
+            np.save(os.path.join(self.data_dir, "agent_ids.npy"), self.agent_ids)
+        self._buffered = 0
+
+    def get_agent_vars_array(self, name):
+        """ One agent reporter as a (steps x agents) array, in agent_ids order. """
+        parts = list(self._chunks[name])
+        if self._buffered > 0:
+            parts.append(self._buffers[name][:self._buffered])
+        if not parts:
+            return np.empty((0, 0))
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate(parts)
+
+    def get_agent_vars_dataframe(self):
+        """ Create a pandas DataFrame from the agent variables.
+
+        Same layout as DataCollector: one column per variable, indexed by
+        Step and AgentID. The frame is built from the chunks on each call.
+        """
+        rep_names = list(self.agent_reporters)
+        if self.agent_ids is None:
+            index = pd.MultiIndex.from_arrays([[], []], names=["Step", "AgentID"])
+            return pd.DataFrame(columns=rep_names, index=index)
+
+        num_agents = len(self.agent_ids)
+        index = pd.MultiIndex.from_arrays([np.repeat(self.steps, num_agents),
+                                           np.tile(self.agent_ids, len(self.steps))],
+                                          names=["Step", "AgentID"])
+        data = {name: self.get_agent_vars_array(name).ravel() for name in rep_names}
+        return pd.DataFrame(data, index=index, columns=rep_names)
+
+    def get_state(self):
+        """ Everything collected so far as named arrays, for checkpoints. """
+        state = {"model_vars/" + name: np.array(values) for name, values in self.model_vars.items()}
+        state["steps"] = np.array(self.steps, dtype=np.int64)
+        if self.agent_ids is not None:
+            state["agent_ids"] = self.agent_ids
+            for name in self.agent_reporters:
+                state["agent_vars/" + name] = np.asarray(self.get_agent_vars_array(name))
+        return state
+
+    def set_state(self, state):
+        """ Replace the collected data with a get_state() result.
+
+        Restored agent data becomes the first chunk, written to data_dir if
+        it is set.
+        """
+        self.model_vars = {name: state["model_vars/" + name].tolist() for name in self.model_reporters}
+        self.steps = state["steps"].tolist()
+        self.agent_ids = state.get("agent_ids")
+        self._chunks = {name: [] for name in self.agent_reporters}
+        self._buffers = {}
+        self._buffered = 0
+        if self.agent_ids is None:
+            return
+
+        for name in self.agent_reporters:
+            chunk = state["agent_vars/" + name]
+            if self.data_dir is not None:
+                path = self._chunk_path(name, 0)
+                np.save(path, chunk)
+                chunk = np.load(path, mmap_mode="r")
+            self._chunks[name].append(chunk)
+
+        if self.data_dir is not None:
+            np.save(os.path.join(self.data_dir, "steps.npy"), np.array(self.steps))
+            np.save(os.path.join(self.data_dir, "agent_ids.npy"), self.agent_ids)
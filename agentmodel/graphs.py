@@ -0,0 +1,205 @@
+import os
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+
+
+# Generated graphs are cached here as edge arrays, keyed by their parameters
+GRAPH_CACHE_DIR = os.environ.get("AGENTMODEL_GRAPH_CACHE",
+                                 os.path.join(os.path.expanduser("~"), ".cache", "agentmodel", "graphs"))
+
+GENERATORS = {
+    "barabasi_albert": lambda n, m, p, seed: nx.barabasi_albert_graph(n, m, seed=seed),
+    "powerlaw_cluster": lambda n, m, p, seed: nx.powerlaw_cluster_graph(n, m, p, seed=seed),
+}
+
+
+def generated_edges(generator, n, m, p=None, seed=11, cache_dir=None):
+    """ Edges of a generated graph as a memory-mapped (E x 2) array.
+
+    The graph is generated once per (generator, n, m, p, seed) and saved
+    under cache_dir. Edges are stored in the order the generator added them,
+    so a graph rebuilt from them has the same neighbor order as the original.
+    """
+    cache_dir = GRAPH_CACHE_DIR if cache_dir is None else cache_dir
+    path = os.path.join(cache_dir, "{}_n{}_m{}_p{}_seed{}.npy".format(generator, n, m, p, seed))
+
+    if not os.path.exists(path):
+        G = GENERATORS[generator](n, m, p, seed)
+        # Every edge joins a new node to older ones, so listing each node's
+        # older neighbors in adjacency order recovers the generation order
+        edges = np.array([(u, v) for u in range(n) for v in G.adj[u] if v < u], dtype=np.int32).reshape(-1, 2)
+
+        _save_cached(path, edges)
+
+    return np.load(path, mmap_mode="r")
+
+
+def generated_adjacency(generator, n, m, p=None, seed=11, cache_dir=None):
+    """ edges_to_adjacency() of generated_edges(), as memory-mapped arrays.
+
+    The arrays are computed once and cached next to the edges, so models
+    that only need neighbor lookups start by loading them.
+    """
+    cache_dir = GRAPH_CACHE_DIR if cache_dir is None else cache_dir
+    stem = os.path.join(cache_dir, "{}_n{}_m{}_p{}_seed{}".format(generator, n, m, p, seed))
+    paths = stem + "_indptr.npy", stem + "_indices.npy"
+
+    if not all(os.path.exists(path) for path in paths):
+        for path, array in zip(paths, edges_to_adjacency(generated_edges(generator, n, m, p, seed, cache_dir), n)):
+            _save_cached(path, array)
+
+    return tuple(np.load(path, mmap_mode="r") for path in paths)
+
+
+def _save_cached(path, array):
+    # Write then rename, so parallel sweep workers never load a partial file
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmp_path, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+def cached_graph(generator, n, m, p=None, seed=11, cache_dir=None):
+    """ networkx graph built from generated_edges(). """
+    G = nx.Graph()
+    G.add_nodes_from(range(n))
+    G.add_edges_from(generated_edges(generator, n, m, p, seed, cache_dir).tolist())
+    return G
+
+
+def cached_csr(generator, n, m, p=None, seed=11, cache_dir=None):
+    """ CSR adjacency built from generated_edges(), without networkx. """
+    return edges_to_csr(generated_edges(generator, n, m, p, seed, cache_dir), n)
+
+
+def edges_to_adjacency(edges, num_nodes):
+    """ Adjacency of an undirected (E x 2) edge array as CSR (indptr, indices)
+    arrays, with each node's neighbors in the order of their edges.
+
+    This is the order networkx lists neighbors in for a graph built from the
+    same edges. The edges should have no self-loops or repeats.
+    """
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+
+    # Both directions of every edge, next to each other in edge order, so a
+    # stable sort by source keeps the edge order within each node
+    sources = edges.ravel()
+    targets = edges[:, ::-1].ravel()
+    order = np.argsort(sources, kind="stable")
+
+    indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=num_nodes), out=indptr[1:])
+    return indptr, targets[order]
+
+
+def edges_to_csr(edges, num_nodes):
+    """ Adjacency of an undirected (E x 2) edge array as CSR (indptr, indices) arrays.
+
+    Neighbors are sorted, and self-loops and repeated edges are dropped.
+    """
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+
+    # Undirected graph: store both directions of every edge
+    sources = np.concatenate([edges[:, 0], edges[:, 1]])
+    targets = np.concatenate([edges[:, 1], edges[:, 0]])
+    order = np.lexsort((targets, sources))
+    sources, targets = sources[order], targets[order]
+
+    keep = sources != targets
+    keep[1:] &= (sources[1:] != sources[:-1]) | (targets[1:] != targets[:-1])
+    sources, targets = sources[keep], targets[keep]
+
+    indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=num_nodes), out=indptr[1:])
+    return indptr, targets
+
+
+def convert_edgelist(path, csr_dir):
+    """ Convert an edge list file once into the binary CSR layout of load_csr().
+
+    path is either a SNAP-style text file with one "source target" pair per
+    line and '#' comments, or a .npy array of shape (E, 2). Node ids are
+    relabeled to 0..n-1, with the original ids saved in node_ids.npy.
+    """
+    if path.endswith(".npy"):
+        edges = np.load(path, mmap_mode="r")
+    else:
+        edges = pd.read_csv(path, sep=r"\s+", comment="#", header=None, usecols=[0, 1],
+                            dtype=np.int64).to_numpy()
+
+    node_ids, edges = np.unique(edges, return_inverse=True)
+    indptr, indices = edges_to_csr(edges.reshape(-1, 2), len(node_ids))
+    save_csr(csr_dir, indptr, indices, node_ids)
+
+
+def save_csr(csr_dir, indptr, indices, node_ids=None):
+    """ Write CSR arrays in the layout of load_csr(). node_ids default to 0..n-1. """
+    if node_ids is None:
+        node_ids = np.arange(len(indptr) - 1)
+    if len(node_ids) < 2**31:
+        indices = indices.astype(np.int32)
+
+    os.makedirs(csr_dir, exist_ok=True)
+    np.save(os.path.join(csr_dir, "indptr.npy"), indptr)
+    np.save(os.path.join(csr_dir, "indices.npy"), indices)
+    np.save(os.path.join(csr_dir, "node_ids.npy"), node_ids)
+
+
+def load_csr(csr_dir):
+    """ Memory-mapped (indptr, indices) written by convert_edgelist(). """
+    return (np.load(os.path.join(csr_dir, "indptr.npy"), mmap_mode="r"),
+            np.load(os.path.join(csr_dir, "indices.npy"), mmap_mode="r"))
+
+
+def to_csr(G):
+    """ Adjacency of a graph with nodes 0..n-1 as CSR (indptr, indices) arrays."""
+    return edges_to_csr(list(G.edges()), G.number_of_nodes())
+
+
+def permute_csr(indptr, indices, order):
+    """ Relabel a CSR adjacency so that row i is the old row order[i].
+
+    Used to move from node space to agent space: order[agent] is the node the
+    agent was placed on, and every neighbor is relabeled to the agent on it.
+    """
+    order = np.asarray(order, dtype=np.int64)
+    inverse = np.empty_like(order)
+    inverse[order] = np.arange(len(order))
+
+    degrees = np.diff(indptr)[order]
+    new_indptr = np.zeros(len(order) + 1, dtype=np.int64)
+    np.cumsum(degrees, out=new_indptr[1:])
+
+    # Gather each old row in the new row order
+    offsets = np.repeat(indptr[order] - new_indptr[:-1], degrees)
+    gathered = indices[offsets + np.arange(new_indptr[-1])]
+    return new_indptr, inverse[gathered]
+
+
+def gather_neighbors(indptr, indices, rows):
+    """ Flattened neighbors of the given rows, and the position in rows each
+    one came from. rows may contain repeats."""
+    rows = np.asarray(rows, dtype=np.int64)
+    degrees = indptr[rows + 1] - indptr[rows]
+    starts = np.zeros(len(rows), dtype=np.int64)
+    np.cumsum(degrees[:-1], out=starts[1:])
+    offsets = np.repeat(indptr[rows] - starts, degrees)
+    neighbors = indices[offsets + np.arange(degrees.sum())].astype(np.int64, copy=False)
+    return neighbors, np.repeat(np.arange(len(rows)), degrees)
+
+
+def gather_replicated(indptr, indices, rows):
+    """ gather_neighbors() for models that run several replicates on one graph.
+
+    Agent r * n + i is node i in replicate r, for an n-node graph. Neighbors
+    are returned with the same numbering, so they stay in the replicate of
+    the row they came from. With a single replicate this is gather_neighbors().
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    num_nodes = len(indptr) - 1
+    offsets = rows - rows % num_nodes
+    neighbors, positions = gather_neighbors(indptr, indices, rows - offsets)
+    return neighbors + offsets[positions], positions
@@ -0,0 +1,76 @@
+var NetworkDiffModule = function(canvas_width, canvas_height) {
+
+    var div_tag = "<div id='graph-container' style='width: " +
+        canvas_width + "px; height: " + canvas_height + "px;'></div>";
+
+    // Append it to #elements:
+    var div = $(div_tag)[0];
+    $("#elements").append(div);
+
+    var s = {
+        container: 'graph-container',
+        settings: {
+            defaultNodeColor: 'black',
+            minEdgeSize: 1,
+            maxEdgeSize: 5
+        }
+    };
+
+    // A frame with edges is the whole graph; later frames only carry the
+    // nodes that changed since the previous one
+    this.render = function(data) {
+        if (data.edges !== undefined) {
+            var graph = JSON.parse(JSON.stringify(data));
+
+            // Update the instance's graph:
+            if (s instanceof sigma) {
+                s.graph.clear();
+                s.graph.read(graph);
+            }
+            // ...or instantiate sigma if needed:
+            else if (typeof s === 'object') {
+                s.graph = graph;
+                s = new sigma(s);
+            }
+
+            //Initialize nodes as a circle, unless the server laid them out
+            s.graph.nodes().forEach(function(node, i, a) {
+                if (node.x === undefined) {
+                    node.x = Math.cos(Math.PI * 2 * i / a.length);
+                    node.y = Math.sin(Math.PI * 2 * i / a.length);
+                }
+            });
+
+            s.refresh();
+            return;
+        }
+
+        if (!(s instanceof sigma)) {
+            return;
+        }
+
+        // Patch the changed nodes in place, keeping their positions
+        data.nodes.forEach(function(update) {
+            var node = s.graph.nodes(update.id);
+            if (node === undefined) {
+                return;
+            }
+            for (var key in update) {
+                if (key !== 'id') {
+                    node[key] = update[key];
+                }
+            }
+        });
+
+        // Positions did not change, so the spatial index can be kept
+        s.refresh({skipIndexation: true});
+    };
+
+    this.reset = function() {
+        if (s instanceof sigma) {
+            s.graph.clear();
+            s.refresh();
+        }
+    };
+
+};
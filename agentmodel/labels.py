@@ -0,0 +1,82 @@
+from collections import deque
+
+
+class LabelIndex:
+    """ Registry of the labels placed by mods, and of where they are visible.
+
+    Each (mod, content) label is stored once, in its mod's dict. A label is
+    visible to the mod itself and to all of its neighbors, so it is pushed
+    to each of them once when it is added. Checking whether an item is
+    labeled for an agent is then a single lookup instead of a scan over
+    every neighboring mod's labels.
+
+    With a lifetime, a label added at step s is visible up to step
+    s + lifetime - 1, and expire() must be called at the start of every
+    step to drop old labels. Once dropped, the mod can label the item again.
+    """
+
+    def __init__(self, lifetime=None):
+        self.lifetime = lifetime
+        # mod id -> content id -> step the label was added at, in the order
+        # the mod added its labels
+        self.labels = {}
+        # content id << 32 | agent id -> number of mods labeling the content
+        # in the agent's neighborhood; ints take less memory than tuples
+        self.visible = {}
+        # (expiry step, mod, content id, neighbors it is visible to), oldest first
+        self._expiring = deque()
+        self._count = 0
+
+    def add(self, mod, content_id, neighbors, step=0):
+        """ Record a label. Returns False if the mod already labeled the item."""
+        mod_labels = self.labels.get(mod.unique_id)
+        if mod_labels is None:
+            mod_labels = self.labels[mod.unique_id] = {}
+        elif content_id in mod_labels:
+            return False
+        mod_labels[content_id] = step
+        self._count += 1
+
+        visible = self.visible
+        base = content_id << 32
+        visible[base | mod.unique_id] = visible.get(base | mod.unique_id, 0) + 1
+        for agent in neighbors:
+            key = base | agent.unique_id
+            visible[key] = visible.get(key, 0) + 1
+        if self.lifetime is not None:
+            self._expiring.append((step + self.lifetime, mod, content_id, neighbors))
+        return True
+
+    def expire(self, step):
+        """ Drop the labels that are no longer visible at step. """
+        expiring, visible = self._expiring, self.visible
+        while expiring and expiring[0][0] <= step:
+            _, mod, content_id, neighbors = expiring.popleft()
+            del self.labels[mod.unique_id][content_id]
+            self._count -= 1
+            base = content_id << 32
+            for agent in (mod,) + tuple(neighbors):
+                key = base | agent.unique_id
+                count = visible[key] - 1
+                if count:
+                    visible[key] = count
+                else:
+                    del visible[key]
+
+    def is_labeled(self, agent, content_id):
+        return (content_id << 32 | agent.unique_id) in self.visible
+
+    def labeled_by(self, mod):
+        """ Content ids of the labels mod currently has, oldest first. """
+        return list(self.labels.get(mod.unique_id, ()))
+
+    def items(self):
+        """ (mod id, content id, step) of every label, in the order they expire. """
+        labels = [(mod_id, content_id, step) for mod_id, mod_labels in self.labels.items()
+                  for content_id, step in mod_labels.items()]
+        # Stable, so labels of one step keep the order their mod added them in
+        labels.sort(key=lambda label: label[2])
+        return labels
+
+    def __len__(self):
+        return self._count
@@ -0,0 +1,191 @@
+import csv
+import json
+import os
+import time
+
+import numpy as np
+
+
+def _to_json(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+class _JsonLinesWriter:
+
+    def __init__(self, path, append):
+        self.file = open(path, "a" if append else "w")
+
+    def write(self, rows):
+        self.file.writelines(json.dumps(row, default=_to_json) + "\n" for row in rows)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class _CsvWriter:
+
+    def __init__(self, path, append):
+        # The header is written with the first rows, unless appending to a
+        # file that has one already
+        self.has_header = append and os.path.exists(path) and os.path.getsize(path) > 0
+        self.file = open(path, "a" if append else "w", newline="")
+        self.writer = None
+
+    def write(self, rows):
+        if self.writer is None:
+            self.writer = csv.DictWriter(self.file, fieldnames=list(rows[0]))
+            if not self.has_header:
+                self.writer.writeheader()
+        self.writer.writerows(rows)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class _ArrowWriter:
+
+    def __init__(self, path, append):
+        # pyarrow is only needed for this format
+        import pyarrow
+
+        if append:
+            raise ValueError("Arrow streams cannot be appended to")
+        self.pa = pyarrow
+        self.path = path
+        self.schema = None
+        self.writer = None
+
+    def write(self, rows):
+        rows = [{name: _to_json(value) for name, value in row.items()} for row in rows]
+        # Later batches keep the column types of the first one
+        batch = self.pa.RecordBatch.from_pylist(rows, schema=self.schema)
+        if self.writer is None:
+            self.schema = batch.schema
+            self.writer = self.pa.ipc.new_stream(self.path, self.schema)
+        self.writer.write_batch(batch)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+WRITERS = {"jsonl": _JsonLinesWriter, "csv": _CsvWriter, "arrow": _ArrowWriter}
+EXTENSIONS = {".jsonl": "jsonl", ".csv": "csv", ".arrow": "arrow", ".arrows": "arrow"}
+
+
+class MetricsSink:
+    """ Streams a model's collected data to files while the model runs.
+
+    Once attach()ed, the sink adds a row after every collect of the model's
+    datacollector: the step and the latest value of every model reporter.
+    With agent_sample set, it also adds one row per sampled agent to
+    agent_path, with the step, the agent's unique_id and the value of every
+    agent reporter. agent_sample is a number of agents or, if below 1, a
+    fraction of them; the sample is drawn once and kept for the whole run.
+
+    The format is "jsonl", "csv" or "arrow" (an Arrow IPC stream, which
+    needs pyarrow) and by default follows the file extension. Rows are
+    buffered and written every flush_every steps, or sooner once
+    flush_seconds have passed since the last write, so memory use does not
+    grow with the run length, the files can be followed while the run goes
+    on, and a run that dies loses at most the buffered steps. Call close()
+    at the end of the run to write the rest.
+    """
+
+    def __init__(self, path, format=None, flush_every=10, flush_seconds=None,
+                 agent_sample=None, agent_path=None, append=False, seed=0):
+        if format is None:
+            format = EXTENSIONS.get(os.path.splitext(path)[1], "jsonl")
+        if format not in WRITERS:
+            raise ValueError("format must be one of {}, not {!r}".format(sorted(WRITERS), format))
+        if agent_path is None and agent_sample is not None:
+            stem, extension = os.path.splitext(path)
+            agent_path = stem + "_agents" + extension
+
+        self.flush_every = flush_every
+        self.flush_seconds = flush_seconds
+        self.agent_sample = agent_sample
+        self.rng = np.random.default_rng(seed)
+        self.agent_ids = None
+
+        self._model_writer = WRITERS[format](path, append)
+        self._agent_writer = WRITERS[format](agent_path, append) if agent_sample is not None else None
+        self._model_rows = []
+        self._agent_rows = []
+        self._buffered = 0
+        self._last_flush = time.monotonic()
+
+    def attach(self, model):
+        """ Write model's data after every collect, starting with what it has
+        collected already. The sink should only be attached to one model. """
+        datacollector = model.datacollector
+        collect = datacollector.collect
+
+        def collect_and_write(model):
+            collect(model)
+            self.write(model)
+
+        datacollector.collect = collect_and_write
+        if any(datacollector.model_vars.values()):
+            self.write(model)
+        return self
+
+    def _sample_agents(self, model):
+        agent_ids = sorted(agent.unique_id for agent in model.schedule.agents)
+        count = self.agent_sample
+        if count < 1:
+            count = int(round(count * len(agent_ids)))
+        count = min(int(count), len(agent_ids))
+        return sorted(self.rng.choice(agent_ids, count, replace=False).tolist())
+
+    def write(self, model):
+        """ Buffer the model's latest collected values. """
+        datacollector = model.datacollector
+        step = model.schedule.steps
+        row = {"Step": step}
+        for name, values in datacollector.model_vars.items():
+            row[name] = values[-1]
+        self._model_rows.append(row)
+
+        if self._agent_writer is not None:
+            if self.agent_ids is None:
+                self.agent_ids = self._sample_agents(model)
+            agents = model.schedule._agents
+            for agent_id in self.agent_ids:
+                agent = agents[agent_id]
+                row = {"Step": step, "AgentID": agent_id}
+                for name, reporter in datacollector.agent_reporters.items():
+                    row[name] = reporter(agent)
+                self._agent_rows.append(row)
+
+        self._buffered += 1
+        if (self._buffered >= self.flush_every or
+                (self.flush_seconds is not None and time.monotonic() - self._last_flush >= self.flush_seconds)):
+            self.flush()
+
+    def flush(self):
+        """ Write the buffered rows. """
+        if self._model_rows:
+            self._model_writer.write(self._model_rows)
+        if self._agent_rows:
+            self._agent_writer.write(self._agent_rows)
+        self._model_rows = []
+        self._agent_rows = []
+        self._buffered = 0
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()
+        self._model_writer.close()
+        if self._agent_writer is not None:
+            self._agent_writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
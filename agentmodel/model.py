@@ -1,12 +1,17 @@
 from mesa import Agent, Model
 from mesa.time import RandomActivation
-from mesa.datacollection import DataCollector
-import networkx as nx
 import numpy as np
 import math
-import random
+from collections import deque
 
-from mesa.space import NetworkGrid
+from .activation import ActiveSetActivation
+from .checkpoint import pack_lists, unpack_lists, write_checkpoint, read_checkpoint, restore_checkpoint
+from .content import ContentCatalog
+from .datacollection import ColumnarDataCollector
+from .labels import LabelIndex
+from .profiling import PhaseProfiler
+from .space import CachedNetworkGrid
+from .steadystate import SteadyStateDetector
 
 def compute_avg_delta(model):
     df = model.datacollector.get_model_vars_dataframe()
@@ -15,21 +20,62 @@ def compute_avg_delta(model):
 
 
 def compute_misinfo_seen(model):
-    misinfo_seen_avg = []
-    for agent in model.schedule.agents:
-        misinfo_seen_avg.append(len(agent.misinfo_seen))
-    return np.average(misinfo_seen_avg)
+    # Totals are kept up to date by the agents as they step
+    return model.total_misinfo_seen / model.schedule.get_agent_count()
 
 def compute_misinfo_blocked(model):
-    misinfo_blocked_avg = []
-    for agent in model.schedule.agents:
-        misinfo_blocked_avg.append(len(agent.misinfo_blocked))
-    return np.average(misinfo_blocked_avg)
+    return model.total_misinfo_blocked / model.schedule.get_agent_count()
 
 
 class MisinfoLabelingNetwork(Model):
+    """A model with some number of misinformers, mods, and regular users.
 
-    def __init__(self, num_agents=30, percent_misinformers=.10, percent_mods=.20, mod_work=10):
+    Agents always keep counts of the misinfo they saw and had blocked. The
+    item ids themselves are kept in misinfo_seen / misinfo_blocked according
+    to misinfo_history: None keeps every item, an integer K keeps only the
+    last K items per agent, and 0 keeps counts only.
+
+    Labels are kept in self.label_index. With label_lifetime set, a label
+    stops blocking items that many steps after it was placed.
+
+    Content items come from self.catalog (see ContentCatalog), which also
+    counts how often each item reached, was seen by and was blocked for an
+    agent. Items can be posted for content_lifetime steps.
+
+    Agent reporters are stored in a ColumnarDataCollector, written under
+    data_dir if it is given.
+
+    With profile=True, time spent in each phase of a step is recorded in
+    self.profiler (see PhaseProfiler); otherwise self.profiler is None.
+
+    save_checkpoint() / load_checkpoint() save a running model and restore
+    it so that it continues exactly as it would have without interruption.
+
+    If steady_window is set, the model stops running once the per-step
+    increments of both model reporters, which are cumulative, settle: their
+    mean over the last steady_window steps is within steady_tolerance of
+    the mean over the steady_window steps before.
+
+    With active_set=True agents are stepped by ActiveSetActivation, which
+    skips mods and regular users without received items. Runs then differ
+    from RandomActivation ones, but agree with them in distribution.
+    """
+
+    def __init__(self, num_agents=30, percent_misinformers=.10, percent_mods=.20, mod_work=10,
+                 misinfo_history=None, label_lifetime=None, content_lifetime=1, steady_window=None,
+                 steady_tolerance=1e-3, active_set=False, data_dir=None, profile=False, seed=None):
+
+        # Constructor arguments that define the model, kept for checkpoints
+        self.params = {"num_agents": num_agents,
+                       "percent_misinformers": percent_misinformers,
+                       "percent_mods": percent_mods,
+                       "mod_work": mod_work,
+                       "misinfo_history": misinfo_history,
+                       "label_lifetime": label_lifetime,
+                       "content_lifetime": content_lifetime,
+                       "steady_window": steady_window,
+                       "steady_tolerance": steady_tolerance,
+                       "active_set": active_set}
 
         self.num_agents = num_agents
         self.num_nodes = num_agents
@@ -38,22 +84,33 @@ class MisinfoLabelingNetwork(Model):
         self.num_mods = int(math.floor(float(num_agents) * percent_mods))
         self.num_regular = self.num_agents - (self.num_misinformers + self.num_mods)
         self.mod_work = mod_work
+        self.misinfo_history = misinfo_history
         
-#         self.G = nx.barabasi_albert_graph(self.num_nodes, int(round(float(self.num_nodes)*0.90)), seed=11)
-        self.G = nx.barabasi_albert_graph(self.num_nodes, int(round(float(self.num_nodes)*0.10)), seed=11)
-#         self.G = nx.powerlaw_cluster_graph(self.num_nodes, int(round(float(self.num_nodes)*0.10)), p=0.9, seed=11)
-        self.grid = NetworkGrid(self.G)
-        self.schedule = RandomActivation(self)
+#         self.grid = CachedNetworkGrid.generated("barabasi_albert", self.num_nodes, int(round(float(self.num_nodes)*0.90)), seed=11)
+        self.grid = CachedNetworkGrid.generated("barabasi_albert", self.num_nodes, int(round(float(self.num_nodes)*0.10)), seed=11)
+#         self.grid = CachedNetworkGrid.generated("powerlaw_cluster", self.num_nodes, int(round(float(self.num_nodes)*0.10)), p=0.9, seed=11)
+        self.active_set = active_set
+        self.schedule = ActiveSetActivation(self) if active_set else RandomActivation(self)
+        self.label_index = LabelIndex(label_lifetime)
+        self.catalog = ContentCatalog(np.random.default_rng(self.random.getrandbits(64)),
+                                      lifetime=content_lifetime)
         self.running = True
+        self.total_misinfo_seen = 0
+        self.total_misinfo_blocked = 0
         
-        self.datacollector = DataCollector(
+        self.datacollector = ColumnarDataCollector(
             model_reporters={"Avg Misinfo Seen": compute_misinfo_seen,
                              "Avg Misinfo Blocked": compute_misinfo_blocked},
-            agent_reporters={"Misinfo Seen": lambda _: len(_.misinfo_seen),
-                             "Misinfo Blocked": lambda _: len(_.misinfo_blocked)}
+            agent_reporters={"Misinfo Seen": "num_misinfo_seen",
+                             "Misinfo Blocked": "num_misinfo_blocked"},
+            data_dir=data_dir
         )
+        self.steady_state = None
+        if steady_window is not None:
+            self.steady_state = SteadyStateDetector(["Avg Misinfo Seen", "Avg Misinfo Blocked"],
+                                                    steady_window, steady_tolerance, increments=True)
 
-        list_of_random_nodes = self.random.sample(self.G.nodes(), self.num_agents)
+        list_of_random_nodes = self.random.sample(range(self.num_nodes), self.num_agents)
 
         # Create agents
         for i in range(self.num_misinformers):
@@ -74,23 +131,106 @@ class MisinfoLabelingNetwork(Model):
             # Add the agent to a random node
             self.grid.place_agent(a, list_of_random_nodes[i])
 
+        if active_set:
+            # Mods and regular users only act on received items, and are
+            # woken when an item arrives
+            for a in self.schedule.agents[:self.num_misinformers]:
+                self.schedule.activate(a)
+
         self.running = True
         self.datacollector.collect(self)
 
+        self.profiler = None
+        if profile:
+            self.profiler = PhaseProfiler()
+            self.profiler.wrap(self, "step", "model step")
+            self.profiler.wrap(self, "generate_content", "content generation")
+            self.profiler.wrap(self.grid, "get_neighbor_agents", "neighbor lookup")
+            self.profiler.wrap(self.label_index, "is_labeled", "label check")
+            self.profiler.wrap(self.label_index, "add", "label add")
+            self.profiler.wrap(self.label_index, "expire", "label expiry")
+            self.profiler.wrap(self.datacollector, "collect", "collect")
+            for agent in self.schedule.agents:
+                self.profiler.wrap(agent, "step", "step " + type(agent).__name__)
+
+    @property
+    def G(self):
+        # The networkx graph is only built for the server
+        return self.grid.G
+
+    def generate_content(self):
+        return self.catalog.generate()
+
     def step(self):
         
-        self.content_ids = []
-        for _ in range(10):
-            self.content_ids.append(random.randint(1,10000))
+        self.content_ids = self.generate_content()
+        self.label_index.expire(self.schedule.steps)
         
         self.schedule.step()
         # collect data
         self.datacollector.collect(self)
+        if self.steady_state is not None:
+            self.steady_state.check(self)
 
     def run_model(self, n):
         for i in range(n):
+            if not self.running:
+                break
             self.step()
 
+    def save_checkpoint(self, path):
+        """ Save the model to path, a .npz file. """
+        agents = self.schedule.agents
+        # In the order they expire in
+        labels = np.array(self.label_index.items(), dtype=np.int64).reshape(-1, 3)
+        arrays = {"num_misinfo_seen": np.array([a.num_misinfo_seen for a in agents], dtype=np.int64),
+                  "num_misinfo_blocked": np.array([a.num_misinfo_blocked for a in agents], dtype=np.int64),
+                  "labels": labels[:, :2],
+                  "label_steps": labels[:, 2]}
+        for name, array in self.catalog.get_state().items():
+            arrays["catalog/" + name] = array
+        for name in ("misinfo_received", "misinfo_seen", "misinfo_blocked"):
+            arrays[name], arrays[name + "_offsets"] = pack_lists([getattr(a, name) for a in agents])
+
+        state = {"total_misinfo_seen": self.total_misinfo_seen,
+                 "total_misinfo_blocked": self.total_misinfo_blocked,
+                 "catalog_rng": self.catalog.rng.bit_generator.state}
+        write_checkpoint(path, self, state, arrays)
+
+    @classmethod
+    def load_checkpoint(cls, path, data_dir=None, profile=False):
+        """ Rebuild a model saved with save_checkpoint(), ready to keep stepping. """
+        header, arrays = read_checkpoint(path)
+        model = cls(data_dir=data_dir, profile=profile, seed=header["seed"], **header["params"])
+        restore_checkpoint(model, header, arrays)
+        model.total_misinfo_seen = header["state"]["total_misinfo_seen"]
+        model.total_misinfo_blocked = header["state"]["total_misinfo_blocked"]
+        model.catalog.rng.bit_generator.state = header["state"]["catalog_rng"]
+        prefix = "catalog/"
+        model.catalog.set_state({name[len(prefix):]: array for name, array in arrays.items()
+                                 if name.startswith(prefix)})
+        model.content_ids = model.catalog.live_ids()
+
+        # Agents are in unique_id order, which is also their index here
+        agents = model.schedule.agents
+        for agent, seen, blocked, received in zip(agents, arrays["num_misinfo_seen"].tolist(),
+                                                  arrays["num_misinfo_blocked"].tolist(),
+                                                  unpack_lists(arrays["misinfo_received"],
+                                                               arrays["misinfo_received_offsets"])):
+            agent.num_misinfo_seen = seen
+            agent.num_misinfo_blocked = blocked
+            agent.misinfo_received = received
+            if model.active_set and received:
+                model.schedule.wake(agent)
+        # Extended in place to keep the deques of a limited misinfo_history
+        for name in ("misinfo_seen", "misinfo_blocked"):
+            for agent, items in zip(agents, unpack_lists(arrays[name], arrays[name + "_offsets"])):
+                getattr(agent, name).extend(items)
+        for (mod_id, content_id), step in zip(arrays["labels"].tolist(), arrays["label_steps"].tolist()):
+            mod = agents[mod_id]
+            model.label_index.add(mod, content_id, model.grid.get_neighbor_agents(mod.pos), step)
+        return model
+
 
 
 class RegularUser(Agent):
@@ -99,35 +239,36 @@ class RegularUser(Agent):
         super().__init__(unique_id, model)
         
         self.misinfo_received = []
-        self.misinfo_blocked = []
-        self.misinfo_seen = []
+        if model.misinfo_history is None:
+            self.misinfo_blocked = []
+            self.misinfo_seen = []
+        else:
+            self.misinfo_blocked = deque(maxlen=model.misinfo_history)
+            self.misinfo_seen = deque(maxlen=model.misinfo_history)
+        self.num_misinfo_blocked = 0
+        self.num_misinfo_seen = 0
         
         self.is_mod = False
         self.is_misinformer = False
         
         
-    def find_if_labeled(self, item, neighbors):
-        if self.is_mod:
-            for item2 in self.misinfo_labeled:
-                if item == item2:
-                    return True
-                        
-        for neighbor in neighbors:
-            if neighbor.is_mod:
-                for item2 in neighbor.misinfo_labeled:
-                    if item == item2:
-                        return True
-        return False
+    def find_if_labeled(self, item):
+        # Labels from this agent (if a mod) and all neighboring mods
+        return self.model.label_index.is_labeled(self, item)
 
     def step(self):
-        neighbors_nodes = self.model.grid.get_neighbors(self.pos, include_center=False)
-        neighbors = self.model.grid.get_cell_list_contents(neighbors_nodes)
-    
+        catalog = self.model.catalog
         for item in self.misinfo_received:
-            if self.find_if_labeled(item, neighbors):
+            if self.find_if_labeled(item):
                 self.misinfo_blocked.append(item)
+                self.num_misinfo_blocked += 1
+                self.model.total_misinfo_blocked += 1
+                catalog.blocked[item] += 1
             else:
                 self.misinfo_seen.append(item)
+                self.num_misinfo_seen += 1
+                self.model.total_misinfo_seen += 1
+                catalog.seen[item] += 1
         
         self.misinfo_received = []
         
@@ -139,13 +280,17 @@ class Misinformer(RegularUser):
         self.is_misinformer = True
 
     def post_misinfo(self):
-        neighbors_nodes = self.model.grid.get_neighbors(self.pos, include_center=False)
-        neighbors = self.model.grid.get_cell_list_contents(neighbors_nodes)
+        neighbors = self.model.grid.get_neighbor_agents(self.pos)
         
-        content_id = random.choice(self.model.content_ids)
+        content_id = self.model.random.choice(self.model.content_ids)
+        reached = 0
         for neighbor in neighbors:
             if content_id not in neighbor.misinfo_received:
                 neighbor.misinfo_received.append(content_id)
+                reached += 1
+                if self.model.active_set:
+                    self.model.schedule.wake(neighbor)
+        self.model.catalog.reached[content_id] += reached
 
     def step(self):
         self.post_misinfo()
@@ -158,17 +303,21 @@ class ModUser(RegularUser):
         super().__init__(unique_id, model)
         
         self.is_mod = True
-        self.misinfo_labeled = []
+
+    @property
+    def misinfo_labeled(self):
+        # Labels are kept once, in the model's label_index
+        return self.model.label_index.labeled_by(self)
 
     def label_misinfo(self):
-        count = self.model.mod_work
-        random.shuffle(self.misinfo_received)
-        for item in self.misinfo_received:
-            if count == 0:
-                break
-            
-            self.misinfo_labeled.append(item)
-            count -= 1
+        neighbors = self.model.grid.get_neighbor_agents(self.pos)
+        
+        # Up to mod_work of the received items, picked at random
+        items = self.misinfo_received
+        if len(items) > self.model.mod_work:
+            items = self.model.random.sample(items, max(self.model.mod_work, 0))
+        for item in items:
+            self.model.label_index.add(self, item, neighbors, self.model.schedule.steps)
         
 
     def step(self):
@@ -0,0 +1,43 @@
+import json
+import time
+from collections import defaultdict
+from functools import wraps
+
+
+class PhaseProfiler:
+    """ Call counts and total wall-clock time per named phase.
+
+    Models built with profile=True create one and wrap() the methods that
+    make up each phase on their own instances, so models built without it
+    run the plain methods at no extra cost. Times are inclusive: a phase
+    that runs inside another one also counts towards the outer phase.
+    """
+
+    def __init__(self):
+        self.calls = defaultdict(int)
+        self.seconds = defaultdict(float)
+
+    def wrap(self, obj, method, phase):
+        """ Time every call to obj.method as phase. """
+        func = getattr(obj, method)
+        calls, seconds = self.calls, self.seconds
+
+        @wraps(func)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                seconds[phase] += time.perf_counter() - start
+                calls[phase] += 1
+
+        setattr(obj, method, timed)
+
+    def to_dict(self):
+        return {phase: {"calls": self.calls[phase], "seconds": self.seconds[phase]}
+                for phase in sorted(self.calls)}
+
+    def save(self, path):
+        """ Write to_dict() as JSON. """
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+
+
+def place_roles(rng, num_agents, replicates, shuffle):
+    """ Agent ids of every replicate in the order roles are handed out.
+
+    Returns a (replicates x num_agents) array whose row r holds agents
+    r * num_agents .. (r + 1) * num_agents - 1, shuffled independently per
+    replicate if shuffle is set.
+    """
+    roles = np.arange(replicates * num_agents).reshape(replicates, num_agents)
+    if shuffle:
+        for row in roles:
+            row[:] = row[0] + rng.permutation(num_agents)
+    return roles
+
+
+class ReplicateCollector:
+    """ Model reporters of a replicate-batched model, per replicate.
+
+    Each reporter takes the model and returns one value per replicate.
+    """
+
+    def __init__(self, model_reporters):
+        self.model_reporters = model_reporters
+        self.model_vars = {name: [] for name in model_reporters}
+
+    def collect(self, model):
+        for name, reporter in self.model_reporters.items():
+            self.model_vars[name].append(np.asarray(reporter(model), dtype=float))
+
+    def get_model_vars_dataframe(self):
+        """ One row per (Step, Replicate) and one column per reporter. """
+        series = {name: np.array(values) for name, values in self.model_vars.items()}
+        steps, replicates = next(iter(series.values())).shape
+        index = pd.MultiIndex.from_product([range(steps), range(replicates)], names=["Step", "Replicate"])
+        return pd.DataFrame({name: values.ravel() for name, values in series.items()}, index=index)
@@ -0,0 +1,64 @@
+import functools
+import glob
+import hashlib
+import json
+import os
+import sys
+
+
+@functools.lru_cache()
+def code_version(model_cls):
+    """ Hash of the sources of model_cls's module and of the agentmodel package. """
+    paths = [sys.modules[model_cls.__module__].__file__]
+    paths += sorted(glob.glob(os.path.join(os.path.dirname(__file__), "*.py")))
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """ Reporter values of single runs, stored on disk as JSON files.
+
+    Entries are keyed on the model class, all of its keyword arguments, the
+    seed, max_steps, the model reporters and the code version, so a run
+    with the same key would reproduce the cached result exactly. Editing
+    the model's module or the agentmodel package changes the code version
+    and with it every key.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, model_cls, kwargs, seed, max_steps, model_reporters):
+        reporters = {name: "{}.{}".format(reporter.__module__, reporter.__qualname__)
+                     for name, reporter in model_reporters.items()}
+        spec = {"model": "{}.{}".format(model_cls.__module__, model_cls.__qualname__),
+                "kwargs": kwargs,
+                "seed": seed,
+                "max_steps": max_steps,
+                "reporters": reporters,
+                "code": code_version(model_cls)}
+        encoded = json.dumps(spec, sort_keys=True, default=lambda v: v.item())
+        return hashlib.sha256(encoded.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".json")
+
+    def get(self, key):
+        """ The stored result for key, or None. """
+        try:
+            with open(self._path(key)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, result):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(result, f)
+        os.replace(tmp_path, path)
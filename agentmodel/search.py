@@ -0,0 +1,137 @@
+import numpy as np
+from SALib.sample import latin, sobol_sequence
+from scipy.spatial import Delaunay
+
+from .sweep import SweepRunner
+
+
+class AdaptiveSweepRunner(SweepRunner):
+    """ SweepRunner that samples parameter space instead of a full grid.
+
+    variable_parameters maps each name to its (low, high) bounds; parameters
+    with int bounds take int values. The sweep starts from a space-filling
+    design of initial_samples points, Latin hypercube ("latin") or Sobol
+    ("sobol"). Each of the refine_rounds rounds then triangulates the points
+    run so far and adds up to refine_samples new points at the centers of the
+    triangles where the objective reporter changes the most, weighted by
+    their size, so that points concentrate along sharp boundaries.
+
+    get_model_vars_dataframe() has the same columns as for SweepRunner, with
+    one row per point and iteration.
+    """
+
+    def __init__(self, model_cls, variable_parameters, objective,
+                 fixed_parameters=None, iterations=1, max_steps=1000,
+                 model_reporters=None, initial_samples=64, design="latin",
+                 refine_rounds=4, refine_samples=32, **kwargs):
+        """ Create a new AdaptiveSweepRunner.
+
+        Args:
+            variable_parameters: Parameter names mapped to (low, high).
+            objective: Name of the model reporter that drives refinement.
+            initial_samples: Number of points in the initial design.
+            design: "latin" or "sobol".
+            refine_rounds: Number of refinement rounds.
+            refine_samples: Maximum number of points added per round.
+
+        The other arguments are the same as for SweepRunner.
+        """
+        super().__init__(model_cls, variable_parameters, fixed_parameters,
+                         iterations, max_steps, model_reporters, **kwargs)
+        if design not in ("latin", "sobol"):
+            raise ValueError("design must be 'latin' or 'sobol', not {!r}".format(design))
+        self.objective = objective
+        self.initial_samples = initial_samples
+        self.design = design
+        self.refine_rounds = refine_rounds
+        self.refine_samples = refine_samples
+
+        self.names = list(self.variable_parameters)
+        bounds = np.array([self.variable_parameters[name] for name in self.names], dtype=float)
+        self.low, self.high = bounds[:, 0], bounds[:, 1]
+        self.is_int = [all(isinstance(b, (int, np.integer)) for b in self.variable_parameters[name])
+                       for name in self.names]
+        self.points = []
+
+    def _make_model_args(self):
+        all_kwargs = []
+        for param_values in self.points:
+            kwargs = dict(zip(self.names, param_values))
+            kwargs.update(self.fixed_parameters)
+            all_kwargs.append(kwargs)
+        return len(self.points) * self.iterations, all_kwargs, list(self.points)
+
+    def _load_results(self, runs):
+        # Runs of later rounds are in the same file; they are loaded once
+        # those rounds have added their points
+        done = {}
+        for record in self._read_results():
+            run = record["Run"]
+            if run >= len(runs):
+                continue
+            if runs[run][1] != record["params"]:
+                raise ValueError("{} was written by a different sweep".format(self.results_path))
+            done[run] = dict(record["reporters"], Steps=record.get("Steps"))
+        return done
+
+    def _to_points(self, unit):
+        """ Points in the unit cube as parameter tuples, without duplicates. """
+        seen = set(self.points)
+        points = []
+        for row in self.low + unit * (self.high - self.low):
+            point = tuple(int(round(value)) if is_int else float(value)
+                          for value, is_int in zip(row, self.is_int))
+            if point not in seen:
+                seen.add(point)
+                points.append(point)
+        return points
+
+    def _initial_design(self):
+        dims = len(self.names)
+        if self.design == "sobol":
+            unit = sobol_sequence.sample(self.initial_samples, dims)
+        else:
+            problem = {"num_vars": dims, "names": self.names, "bounds": [[0, 1]] * dims}
+            unit = latin.sample(problem, self.initial_samples, seed=self.seed)
+        return self._to_points(np.asarray(unit))
+
+    def outcomes(self):
+        """ Mean objective over iterations, for every point run so far. """
+        totals = {}
+        for model_key, values in self.model_vars.items():
+            totals.setdefault(model_key[:-1], []).append(values[self.objective])
+        return {point: np.mean(values) for point, values in totals.items()}
+
+    def _refined_points(self):
+        outcomes = self.outcomes()
+        points = list(outcomes)
+        unit = (np.array(points, dtype=float) - self.low) / (self.high - self.low)
+        values = np.array([outcomes[point] for point in points])
+
+        if len(self.names) == 1:
+            # Intervals between neighboring points play the role of triangles
+            order = np.argsort(unit[:, 0])
+            simplices = np.column_stack([order[:-1], order[1:]])
+        else:
+            simplices = Delaunay(unit).simplices
+
+        corners = unit[simplices]
+        change = np.ptp(values[simplices], axis=1)
+        size = np.ptp(corners, axis=1).max(axis=1)
+        score = change * size
+        best = np.argsort(score)[::-1][:self.refine_samples]
+        best = best[score[best] > 0]
+        return self._to_points(corners[best].mean(axis=1))
+
+    def run_all(self):
+        """ Run the initial design, then every refinement round. """
+        if not self.points:
+            self.points = self._initial_design()
+        super().run_all()
+
+        for _ in range(self.refine_rounds):
+            new_points = self._refined_points()
+            if not new_points:
+                break
+            self.points.extend(new_points)
+            super().run_all()
@@ -1,7 +1,7 @@
 from mesa.visualization.ModularVisualization import ModularServer
 from mesa.visualization.UserParam import UserSettableParameter
 from mesa.visualization.modules import ChartModule
-from mesa.visualization.modules import NetworkModule
+from .visualization import NetworkLODModule
 from .model import MisinfoLabelingNetwork
 
 
@@ -10,38 +10,46 @@ def compute_color(agent):
         return "#0000FF" # blue
     elif agent.is_misinformer:
         return "#CC0000" # red
-    elif len(agent.misinfo_seen) == 0:
+    elif agent.num_misinfo_seen == 0:
         return "#037f51" # green
-    elif len(agent.misinfo_seen) < 10 :
+    elif agent.num_misinfo_seen < 10 :
         return "#FFFF00" # yellow
     else:
         return "#FFA500" # orange
 
 
-def network_portrayal(G):
+def node_portrayal(G):
     # The model ensures there is 0 or 1 agent per node
+    return [{'id': node_id,
+             'size': 2,
+             'color': compute_color(agents[0]),
+             'label': None if not agents else 'Agent:{} Misinfo Seen:{} Blocked: {}'.format(agents[0].unique_id,
+                                                                          agents[0].num_misinfo_seen, 
+                                                                          agents[0].num_misinfo_blocked),
+             }
+            for (node_id, agents) in G.nodes.data('agent')]
 
-    portrayal = dict()
-    portrayal['nodes'] = [{'id': node_id,
-                           'size': 2,
-                           'color': compute_color(agents[0]),
-                           'label': None if not agents else 'Agent:{} Misinfo Seen:{} Blocked: {}'.format(agents[0].unique_id,
-                                                                                        len(agents[0].misinfo_seen), 
-                                                                                        len(agents[0].misinfo_blocked)),
-                           }
-                          for (node_id, agents) in G.nodes.data('agent')]
 
-    portrayal['edges'] = [{'id': edge_id,
-                           'source': source,
-                           'target': target,
-                           'color': '#000000',
-                           }
-                          for edge_id, (source, target) in enumerate(G.edges)]
+def edge_portrayal(G):
+    return [{'id': edge_id,
+             'source': source,
+             'target': target,
+             'color': '#000000',
+             }
+            for edge_id, (source, target) in enumerate(G.edges)]
+
 
+def network_portrayal(G):
+    portrayal = dict()
+    portrayal['nodes'] = node_portrayal(G)
+    portrayal['edges'] = edge_portrayal(G)
     return portrayal
 
 
-grid = NetworkModule(network_portrayal, 500, 900, library='sigma')
+# Edges never change, so after the first frame only changed nodes are sent.
+# Graphs above max_nodes (num_agents goes up to 10000) are drawn as a sample
+# with a precomputed layout
+grid = NetworkLODModule(node_portrayal, edge_portrayal, 500, 900, max_nodes=1000)
 chart = ChartModule([
     {"Label": "Avg Misinfo Seen", 
      "Color": "Black"},
@@ -52,7 +60,7 @@ chart = ChartModule([
 
 
 model_params = {
-    "num_agents": UserSettableParameter('slider', "Number of agents", 30, 0, 100, 10,
+    "num_agents": UserSettableParameter('slider', "Number of agents", 30, 10, 10000, 10,
                                         description="Choose how many total agents to include in the model"),
     "percent_misinformers": UserSettableParameter('slider', "Percent misinformers", .1, 0, 1.0, 0.05,
                                        description="Choose what percent misinformers to include in the model"),
@@ -0,0 +1,46 @@
+import numpy as np
+
+
+class SnapshotRing:
+    """ The last `window` snapshots of a per-agent value, for all agents.
+
+    Snapshots live in one preallocated (window x agents) array that is
+    overwritten in place, so taking a snapshot allocates nothing. Agents are
+    indexed by unique_id and keep their own snapshot counts, since in the
+    Mesa models they snapshot one at a time during a step.
+    """
+
+    def __init__(self, num_agents, window=5, dtype=np.int64):
+        self.window = window
+        self.values = np.zeros((window, num_agents), dtype=dtype)
+        self.counts = np.zeros(num_agents, dtype=np.int64)
+        self._agents = np.arange(num_agents)
+
+    def record(self, agent_id, value):
+        count = self.counts[agent_id]
+        self.values[count % self.window, agent_id] = value
+        self.counts[agent_id] = count + 1
+
+    def record_all(self, values):
+        self.values[self.counts % self.window, self._agents] = values
+        self.counts += 1
+
+    # Rows that were never written are zero, so agents without snapshots
+    # get a delta of 0 below
+
+    def delta(self, agent_id):
+        """ Newest minus oldest snapshot of one agent. """
+        count = self.counts[agent_id]
+        newest = self.values[(count - 1) % self.window, agent_id]
+        oldest = self.values[max(count - self.window, 0) % self.window, agent_id]
+        return int(newest - oldest)
+
+    def deltas(self):
+        """ Newest minus oldest snapshot of every agent. """
+        newest = self.values[(self.counts - 1) % self.window, self._agents]
+        oldest = self.values[np.maximum(self.counts - self.window, 0) % self.window, self._agents]
+        return newest - oldest
+
+    def average_deltas(self):
+        """ deltas() divided by the number of snapshots each agent has kept. """
+        return self.deltas() / np.clip(self.counts, 1, self.window)
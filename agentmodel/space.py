@@ -0,0 +1,80 @@
+import networkx as nx
+import numpy as np
+from mesa.space import NetworkGrid
+
+from .graphs import generated_edges, generated_adjacency
+
+
+class CachedNetworkGrid(NetworkGrid):
+    """ NetworkGrid that caches the agents around each node.
+
+    The graphs in these models never change after construction, so the
+    grid is built straight from arrays: neighbors come from CSR adjacency
+    arrays (see graphs.edges_to_adjacency), in the order networkx would
+    list them, and the agents on each node from a list per node. The cache
+    of neighbor agents is dropped whenever an agent is placed, moved or
+    removed.
+
+    The networkx graph is only built when G is first used, e.g. by the
+    server. Its 'agent' node attributes are the grid's lists, so it stays
+    in sync with the grid.
+    """
+
+    def __init__(self, indptr, indices, edges):
+        # NetworkGrid.__init__ needs the networkx graph, so it is not called
+        # Plain views of memory-mapped arrays, which are much faster to slice
+        self.indptr, self.indices = np.asarray(indptr), np.asarray(indices)
+        self.edges = edges
+        self._cells = [[] for _ in range(len(indptr) - 1)]
+        self._neighbor_agents = {}
+        self._G = None
+
+    @classmethod
+    def generated(cls, generator, n, m, p=None, seed=11):
+        """ Grid over a generated graph, loaded from the graph cache. """
+        indptr, indices = generated_adjacency(generator, n, m, p, seed)
+        return cls(indptr, indices, generated_edges(generator, n, m, p, seed))
+
+    @property
+    def G(self):
+        if self._G is None:
+            G = nx.Graph()
+            G.add_nodes_from((node_id, {'agent': cell}) for node_id, cell in enumerate(self._cells))
+            G.add_edges_from(self.edges.tolist())
+            self._G = G
+        return self._G
+
+    def get_neighbors(self, node_id, include_center=False):
+        neighbors = self.indices[self.indptr[node_id]:self.indptr[node_id + 1]].tolist()
+        if include_center:
+            neighbors.append(node_id)
+        return neighbors
+
+    def get_neighbor_agents(self, node_id):
+        """ Agents on the nodes adjacent to node_id, as a tuple. """
+        neighbors = self._neighbor_agents.get(node_id)
+        if neighbors is None:
+            neighbors_nodes = self.get_neighbors(node_id, include_center=False)
+            neighbors = tuple(self.get_cell_list_contents(neighbors_nodes))
+            self._neighbor_agents[node_id] = neighbors
+        return neighbors
+
+    def invalidate_cache(self):
+        self._neighbor_agents.clear()
+
+    def _place_agent(self, agent, node_id):
+        self._cells[node_id].append(agent)
+        self.invalidate_cache()
+
+    def _remove_agent(self, agent, node_id):
+        self._cells[node_id].remove(agent)
+        self.invalidate_cache()
+
+    def is_cell_empty(self, node_id):
+        return False if self._cells[node_id] else True
+
+    def get_all_cell_contents(self):
+        return self.iter_cell_list_contents(range(len(self._cells)))
+
+    def iter_cell_list_contents(self, cell_list):
+        return [agent for node_id in cell_list for agent in self._cells[node_id]]
@@ -0,0 +1,37 @@
+class SteadyStateDetector:
+    """ Stops a model once its model reporters stop changing.
+
+    check() is called after every collect. Once each of the reporters has
+    stayed within tolerance (max minus min) over its last `window` collected
+    values, the model's running flag is set to False, which ends
+    BatchRunner / SweepRunner runs at that step.
+
+    With increments=True the reporters are taken to be cumulative totals,
+    which keep growing in a steady state. The test is then on their rate:
+    the mean per-step increment over the last `window` steps has to be
+    within tolerance of the mean increment over the `window` steps before.
+    """
+
+    def __init__(self, reporters, window=10, tolerance=1e-3, increments=False):
+        self.reporters = reporters
+        self.window = window
+        self.tolerance = tolerance
+        self.increments = increments
+
+    def _is_steady(self, values):
+        if not self.increments:
+            values = values[-self.window:]
+            return len(values) == self.window and max(values) - min(values) <= self.tolerance
+
+        if len(values) < 2 * self.window + 1:
+            return False
+        newest, middle, oldest = values[-1], values[-1 - self.window], values[-1 - 2 * self.window]
+        return abs((newest - middle) - (middle - oldest)) / self.window <= self.tolerance
+
+    def check(self, model):
+        """ Set model.running to False if the model is steady. Returns whether it is. """
+        for name in self.reporters:
+            if not self._is_steady(model.datacollector.model_vars[name]):
+                return False
+        model.running = False
+        return True
@@ -0,0 +1,196 @@
+import copy
+import hashlib
+import inspect
+import json
+import os
+from multiprocessing import Pool
+
+import numpy as np
+from mesa.batchrunner import BatchRunner
+from tqdm import tqdm
+
+from .metrics import MetricsSink
+from .resultcache import ResultCache
+
+
+def run_seed(seed, params, iteration):
+    """ Seed for a single run, derived only from the sweep seed, the run's
+    variable parameter values and its iteration number. """
+    digest = hashlib.sha256(json.dumps(params, sort_keys=True).encode()).digest()
+    entropy = [seed, iteration, int.from_bytes(digest[:8], "little")]
+    return int(np.random.SeedSequence(entropy).generate_state(1)[0])
+
+
+def _to_json(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _run_task(task):
+    """ Build and run one model; executed in the worker processes. """
+    run, seed, model_cls, kwargs, max_steps, model_reporters, profile_dir, metrics_dir = task
+    if profile_dir is not None:
+        kwargs = dict(kwargs, profile=True)
+    model = model_cls(seed=seed, **kwargs)
+    sink = None
+    if metrics_dir is not None:
+        sink = MetricsSink(os.path.join(metrics_dir, "run_{:05d}.jsonl".format(run))).attach(model)
+    while model.running and model.schedule.steps < max_steps:
+        model.step()
+    if sink is not None:
+        sink.close()
+    if profile_dir is not None:
+        model.profiler.save(os.path.join(profile_dir, "run_{:05d}.json".format(run)))
+    values = {var: _to_json(reporter(model)) for var, reporter in model_reporters.items()}
+    # Models that detect a steady state stop before max_steps
+    return run, values, model.schedule.steps
+
+
+class SweepRunner(BatchRunner):
+    """ Parallel, resumable replacement for BatchRunner.
+
+    Runs are spread over a process pool and each run gets its own seed,
+    derived from the sweep seed, its parameter values and iteration, so
+    results do not depend on the number of processes, the order runs finish
+    in or the other points of the sweep. If results_path
+    is given, every finished run is appended to it as a JSON line right away;
+    running the same sweep again skips the runs already in the file. The
+    number of steps each run took is reported as "Steps". If
+    profile_dir is given, models are built with profile=True and each run's
+    phase timings are written there as run_<run>.json. If metrics_dir is
+    given, each run streams its model reporters there as run_<run>.jsonl
+    while it runs (see MetricsSink). If cache_dir is given, results are
+    also stored in a ResultCache there, and runs found in it are loaded
+    instead of simulated (and neither profiled nor streamed).
+
+    get_model_vars_dataframe() returns the same table as BatchRunner.
+    """
+
+    def __init__(self, model_cls, variable_parameters=None,
+                 fixed_parameters=None, iterations=1, max_steps=1000,
+                 model_reporters=None, processes=None, seed=0,
+                 results_path=None, profile_dir=None, metrics_dir=None,
+                 cache_dir=None, display_progress=True):
+        """ Create a new SweepRunner.
+
+        Args:
+            processes: Number of worker processes, defaults to the number of
+                CPUs. With 1, runs execute in this process.
+            seed: Sweep seed that all per-run seeds are derived from.
+            results_path: JSON lines file that results are streamed to and
+                resumed from.
+            profile_dir: Directory for per-run PhaseProfiler output.
+            metrics_dir: Directory for per-run MetricsSink output.
+            cache_dir: Directory of a ResultCache shared between sweeps.
+
+        The other arguments are the same as for BatchRunner.
+        """
+        super().__init__(model_cls, variable_parameters, fixed_parameters,
+                         iterations, max_steps, model_reporters,
+                         display_progress=display_progress)
+        self.model_vars = {}
+        self.processes = processes
+        self.seed = seed
+        self.results_path = results_path
+        if profile_dir is not None and "profile" not in inspect.signature(model_cls).parameters:
+            raise ValueError("{} does not support profiling".format(model_cls.__name__))
+        self.profile_dir = profile_dir
+        self.metrics_dir = metrics_dir
+        self.cache = ResultCache(cache_dir) if cache_dir is not None else None
+
+    def _make_tasks(self):
+        """ One (model key, params, task) entry per run, in run order. """
+        _, all_kwargs, all_param_values = self._make_model_args()
+        param_names = list(self.variable_parameters.keys())
+
+        runs = []
+        for kwargs, param_values in zip(all_kwargs, all_param_values):
+            params = {name: _to_json(value) for name, value in zip(param_names, param_values or ())}
+            for iteration in range(self.iterations):
+                run = len(runs)
+                model_key = (param_values or ()) + (run,)
+                task = (run, run_seed(self.seed, params, iteration), self.model_cls,
+                        copy.deepcopy(kwargs), self.max_steps, self.model_reporters, self.profile_dir,
+                        self.metrics_dir)
+                runs.append((model_key, params, task))
+        return runs
+
+    def _read_results(self):
+        """ Records in results_path, if it exists. """
+        if self.results_path is None or not os.path.exists(self.results_path):
+            return
+        with open(self.results_path) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    def _load_results(self, runs):
+        """ Results already in results_path, by run number. """
+        done = {}
+        for record in self._read_results():
+            run = record["Run"]
+            if run >= len(runs) or runs[run][1] != record["params"]:
+                raise ValueError("{} was written by a different sweep".format(self.results_path))
+            done[run] = dict(record["reporters"], Steps=record.get("Steps"))
+        return done
+
+    def _cache_key(self, task):
+        _, seed, model_cls, kwargs, max_steps, model_reporters, _, _ = task
+        return self.cache.key(model_cls, kwargs, seed, max_steps, model_reporters)
+
+    def _run_tasks(self, tasks):
+        """ (run, reporter values, steps) for every task, from the cache where possible. """
+        if self.cache is not None:
+            missing = []
+            for task in tasks:
+                result = self.cache.get(self._cache_key(task))
+                if result is None:
+                    missing.append(task)
+                else:
+                    yield task[0], result["reporters"], result["Steps"]
+            tasks = missing
+
+        tasks_by_run = {task[0]: task for task in tasks}
+        for run, values, steps in self._simulate(tasks):
+            if self.cache is not None:
+                self.cache.put(self._cache_key(tasks_by_run[run]), {"reporters": values, "Steps": steps})
+            yield run, values, steps
+
+    def _simulate(self, tasks):
+        if self.processes == 1:
+            for task in tasks:
+                yield _run_task(task)
+            return
+
+        with Pool(self.processes) as pool:
+            for result in pool.imap_unordered(_run_task, tasks):
+                yield result
+
+    def run_all(self):
+        """ Run every parameter combination not already in results_path or model_vars. """
+        runs = self._make_tasks()
+        done = self._load_results(runs)
+        for run, values in done.items():
+            self.model_vars[runs[run][0]] = values
+
+        # Runs finished earlier by this runner are kept too
+        tasks = [task for model_key, _, task in runs if model_key not in self.model_vars]
+        for directory in (self.profile_dir, self.metrics_dir):
+            if directory is not None:
+                os.makedirs(directory, exist_ok=True)
+        out = open(self.results_path, "a") if self.results_path is not None else None
+        try:
+            with tqdm(total=len(runs), initial=len(runs) - len(tasks), disable=not self.display_progress) as pbar:
+                for run, values, steps in self._run_tasks(tasks):
+                    model_key, params, task = runs[run]
+                    self.model_vars[model_key] = dict(values, Steps=steps)
+                    if out is not None:
+                        record = {"Run": run, "Seed": task[1], "params": params, "Steps": steps,
+                                  "reporters": values}
+                        out.write(json.dumps(record) + "\n")
+                        out.flush()
+                    pbar.update()
+        finally:
+            if out is not None:
+                out.close()
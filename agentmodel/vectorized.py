@@ -0,0 +1,341 @@
+from mesa import Model
+from mesa.time import BaseScheduler
+from mesa.datacollection import DataCollector
+import numpy as np
+import math
+
+from .graphs import cached_csr, load_csr, permute_csr, gather_replicated
+from .profiling import PhaseProfiler
+from .replicates import ReplicateCollector, place_roles
+
+
+# Content ids are drawn from 1..MAX_CONTENT_ID, same as MisinfoLabelingNetwork
+MAX_CONTENT_ID = 10000
+CONTENT_PER_STEP = 10
+# Bytes per agent in a bitset over content ids
+ROW_BYTES = (MAX_CONTENT_ID + 1 + 7) // 8
+
+
+def compute_misinfo_seen(model):
+    return np.average(model.misinfo_seen)
+
+
+def compute_misinfo_blocked(model):
+    return np.average(model.misinfo_blocked)
+
+
+def compute_misinfo_seen_replicates(model):
+    return model.misinfo_seen.reshape(model.replicates, -1).mean(axis=1)
+
+
+def compute_misinfo_blocked_replicates(model):
+    return model.misinfo_blocked.reshape(model.replicates, -1).mean(axis=1)
+
+
+def find_sorted(sorted_keys, keys):
+    """ Positions of keys in a sorted array, and which of them are present."""
+    if len(sorted_keys) == 0:
+        return np.zeros(len(keys), dtype=np.int64), np.zeros(len(keys), dtype=bool)
+    pos = np.minimum(np.searchsorted(sorted_keys, keys), len(sorted_keys) - 1)
+    return pos, sorted_keys[pos] == keys
+
+
+def test_bits(bits, keys):
+    """ Whether the bits of agent * (MAX_CONTENT_ID + 1) + content_id keys are
+    set in an agents x ROW_BYTES bitset."""
+    agents, items = np.divmod(keys, MAX_CONTENT_ID + 1)
+    return ((bits[agents, items >> 3] >> (items & 7)) & 1).astype(bool)
+
+
+def set_bits(bits, keys):
+    agents, items = np.divmod(keys, MAX_CONTENT_ID + 1)
+    np.bitwise_or.at(bits, (agents, items >> 3), (1 << (items & 7)).astype(np.uint8))
+
+
+def clear_bits(bits, keys):
+    """ Clear the bytes that hold the bits of keys, with any other bits in them. """
+    agents, items = np.divmod(keys, MAX_CONTENT_ID + 1)
+    bits[agents, items >> 3] = 0
+
+
+class VectorizedMisinfoNetwork(Model):
+    """Array-backed version of MisinfoLabelingNetwork.
+
+    The graph is stored as CSR arrays in agent order and all per-agent state
+    lives in NumPy arrays, so a tick is a handful of batched operations
+    instead of one Python step() per agent.
+
+    RandomActivation is reproduced by giving every agent a random activation
+    time in [0, 1) each step. An item posted at time t reaches a neighbor in
+    the same step if the neighbor activates after t and in the next step
+    otherwise, and a label can only block items checked after the mod's
+    activation. Single runs differ from the Mesa version, but the
+    "Avg Misinfo Seen" / "Avg Misinfo Blocked" series agree in distribution.
+
+    Received items and labels are int64 keys of the form
+    agent * (MAX_CONTENT_ID + 1) + content_id. Labels of earlier steps are
+    always visible by now, so they are kept as one bit per key in a bitset
+    of agents x content ids. Only this step's labels need the time they
+    became visible; they are kept as sorted keys per labeling call and
+    folded into the bitset at the end of the step. Checking an item then
+    costs the same however long the model has run.
+
+    graph can name a directory written by graphs.convert_edgelist() to run
+    on a real network instead of the generated one. It is memory-mapped as
+    is, with one agent per node, so num_agents is taken from the graph.
+
+    replicates > 1 runs that many replicates of the model together on the
+    same graph. Per-agent arrays then hold all replicates back to back
+    (agent r * num_agents + i is agent i of replicate r), each replicate gets
+    its own random role placement and its own content ids every step, and
+    model reporters are computed over all replicates. replicate_collector
+    keeps both reporters per replicate.
+
+    With reshare_probability > 0 items spread in cascades: an agent that
+    sees an item passes it on to all of its neighbors with that probability,
+    at its own activation time, for items that are at most max_hops - 1
+    hops away from the misinformer that posted them. A step runs in waves,
+    one per hop: each wave labels and checks the items received in it, and
+    its resharers form the frontier of the next wave. Mods spend mod_work
+    over all waves of a step. A label placed in a later wave never blocks
+    an item checked in an earlier one. The keys received in a step are
+    marked in a second bitset, cleared at the end of the step, so a wave
+    costs about the items it delivers however deep the cascade goes.
+
+    With profile=True, time spent in each phase of a step is recorded in
+    self.profiler (see PhaseProfiler); otherwise self.profiler is None.
+    """
+
+    def __init__(self, num_agents=30, percent_misinformers=.10, percent_mods=.20, mod_work=10,
+                 reshare_probability=0.0, max_hops=4, graph=None, replicates=1, profile=False, seed=None):
+        # first_by_key() packs hops into keys in base max_hops + 1
+        if max_hops < 1:
+            raise ValueError("max_hops must be at least 1, not {!r}".format(max_hops))
+
+        if graph is None:
+            indptr, indices = cached_csr("barabasi_albert", num_agents, int(round(float(num_agents)*0.10)), seed=11)
+        else:
+            indptr, indices = load_csr(graph)
+            num_agents = len(indptr) - 1
+
+        self.num_agents = num_agents
+        self.num_nodes = num_agents
+
+        self.num_misinformers = int(math.floor(float(num_agents) * percent_misinformers))
+        self.num_mods = int(math.floor(float(num_agents) * percent_mods))
+        self.num_regular = self.num_agents - (self.num_misinformers + self.num_mods)
+        self.mod_work = mod_work
+        self.reshare_probability = reshare_probability
+        self.max_hops = max_hops
+        self.replicates = replicates
+        self.size = size = replicates * num_agents
+
+        self.schedule = BaseScheduler(self)
+
+        # Replicates share the graph, so they get the placement of a loaded
+        # graph below
+        if graph is None and replicates == 1:
+            # Agents are placed on nodes the same way as the Mesa version, and
+            # the adjacency is relabeled from node ids to agent ids
+            list_of_random_nodes = self.random.sample(range(self.num_nodes), self.num_agents)
+            self.indptr, self.indices = permute_csr(indptr, indices, list_of_random_nodes)
+        else:
+            self.indptr, self.indices = indptr, indices
+        self.rng = np.random.default_rng(self.random.getrandbits(64))
+
+        # Roles follow agent ids: misinformers first, then mods, then regular
+        # users. Agents on a loaded graph keep their node ids, so the roles
+        # are shuffled instead.
+        roles = place_roles(self.rng, num_agents, replicates, shuffle=graph is not None or replicates > 1)
+        self.misinformers = roles[:, :self.num_misinformers].ravel()
+        self.mods = roles[:, self.num_misinformers:self.num_misinformers + self.num_mods].ravel()
+        self.is_mod = np.zeros(size, dtype=bool)
+        self.is_mod[self.mods] = True
+        self.is_misinformer = np.zeros(size, dtype=bool)
+        self.is_misinformer[self.misinformers] = True
+
+        self.misinfo_seen = np.zeros(size, dtype=np.int64)
+        self.misinfo_blocked = np.zeros(size, dtype=np.int64)
+        # This step's content ids, one row per replicate
+        self.content_ids = np.empty((replicates, 0), dtype=np.int64)
+
+        # Items delivered after the receiver already acted wait for next
+        # step, with the number of hops they took to get there
+        self.misinfo_pending = np.empty(0, dtype=np.int64)
+        self.misinfo_pending_hops = np.empty(0, dtype=np.int64)
+        self._late = []
+        # Labels each mod can still place this step, indexed by agent
+        self.mod_budget = np.zeros(size, dtype=np.int64)
+        # Bitset of the labels placed before this step, allocated once there
+        # are any, and (keys, times) of the ones placed in this step with the
+        # time each one became visible
+        self.labeled = None
+        self.step_labels = []
+        # Bitset of the keys received this step, only needed for cascades
+        self.received = None
+        self.activation = self.rng.random(size)
+
+        self.datacollector = DataCollector(
+            model_reporters={"Avg Misinfo Seen": compute_misinfo_seen,
+                             "Avg Misinfo Blocked": compute_misinfo_blocked}
+        )
+        self.replicate_collector = ReplicateCollector(
+            model_reporters={"Avg Misinfo Seen": compute_misinfo_seen_replicates,
+                             "Avg Misinfo Blocked": compute_misinfo_blocked_replicates}
+        )
+
+        self.running = True
+        self.collect()
+
+        self.profiler = None
+        if profile:
+            self.profiler = PhaseProfiler()
+            self.profiler.wrap(self, "step", "model step")
+            self.profiler.wrap(self, "post_misinfo", "posting")
+            self.profiler.wrap(self, "reshare_misinfo", "resharing")
+            self.profiler.wrap(self, "label_misinfo", "labeling")
+            self.profiler.wrap(self, "check_labels", "label check")
+            self.profiler.wrap(self, "collect", "collect")
+
+    def first_by_key(self, keys, hops):
+        """ Sorted unique keys, each with the fewest hops it came with. """
+        combined = np.unique(keys * (self.max_hops + 1) + hops)
+        keys, hops = np.divmod(combined, self.max_hops + 1)
+        first = np.ones(len(keys), dtype=bool)
+        first[1:] = keys[1:] != keys[:-1]
+        return keys[first], hops[first]
+
+    def deliver(self, keys, hops, send_times):
+        """ Items sent at send_times that their receivers get this step.
+
+        The others are received next step; they are collected in self._late
+        and become the pending items at the end of the step.
+        """
+        on_time = self.activation[keys // (MAX_CONTENT_ID + 1)] > send_times
+        self._late.append((keys[~on_time], hops[~on_time]))
+        return keys[on_time], hops[on_time]
+
+    def post_misinfo(self):
+        # Every misinformer sends one of this step's items to all neighbors
+        picked = self.rng.integers(0, self.content_ids.shape[1], len(self.misinformers))
+        posted = self.content_ids[self.misinformers // self.num_agents, picked]
+        receivers, senders = gather_replicated(self.indptr, self.indices, self.misinformers)
+        keys = receivers * (MAX_CONTENT_ID + 1) + posted[senders]
+
+        keys, hops = self.deliver(keys, np.ones(len(keys), dtype=np.int64), self.activation[senders])
+        # Dropping duplicate keys also drops items an agent already has waiting
+        return self.first_by_key(np.concatenate([self.misinfo_pending, keys]),
+                                 np.concatenate([self.misinfo_pending_hops, hops]))
+
+    def reshare_misinfo(self, seen, hops):
+        """ The next wave of a cascade: items from seen, the keys seen in this
+        wave, passed on to all neighbors of their agents. Returns the keys and
+        hops received in this step that were not received earlier in it. """
+        shared = hops < self.max_hops
+        shared[shared] = self.rng.random(np.count_nonzero(shared)) < self.reshare_probability
+        seen, hops = seen[shared], hops[shared]
+
+        agents = seen // (MAX_CONTENT_ID + 1)
+        receivers, senders = gather_replicated(self.indptr, self.indices, agents)
+        keys = receivers * (MAX_CONTENT_ID + 1) + seen[senders] % (MAX_CONTENT_ID + 1)
+        keys, hops = self.deliver(keys, hops[senders] + 1, self.activation[agents][senders])
+
+        # Agents get one copy of an item per step
+        keys, hops = self.first_by_key(keys, hops)
+        new = ~test_bits(self.received, keys)
+        return keys[new], hops[new]
+
+    def label_misinfo(self, received):
+        # Each mod labels up to its remaining mod_work of its received items,
+        # picked at random
+        mod_received = received[self.is_mod[received // (MAX_CONTENT_ID + 1)]]
+        if self.mod_work <= 0 or len(mod_received) == 0:
+            return
+
+        mods = mod_received // (MAX_CONTENT_ID + 1)
+        order = np.lexsort((self.rng.random(len(mod_received)), mods))
+        mods, mod_received = mods[order], mod_received[order]
+        group_start = np.flatnonzero(np.r_[True, mods[1:] != mods[:-1]])
+        rank = np.arange(len(mods)) - np.repeat(group_start, np.diff(np.r_[group_start, len(mods)]))
+        labeled = rank < self.mod_budget[mods]
+        if not labeled.any():
+            return
+        mods, items = mods[labeled], mod_received[labeled] % (MAX_CONTENT_ID + 1)
+        self.mod_budget -= np.bincount(mods, minlength=self.size)
+
+        # A label is visible to the mod and to all of the mod's neighbors
+        # from the moment the mod acts, so each (agent, item) key keeps the
+        # earliest of its label times. With several replicates there are
+        # many distinct items per step, so all of them are spread at once.
+        times = self.schedule.steps + self.activation[mods]
+        neighbors, label = gather_replicated(self.indptr, self.indices, mods)
+        keys = np.concatenate([mods, neighbors]) * (MAX_CONTENT_ID + 1) + np.concatenate([items, items[label]])
+        times = np.concatenate([times, times[label]])
+        order = np.argsort(keys)
+        keys, times = keys[order], times[order]
+        first = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        keys, times = keys[first], np.minimum.reduceat(times, first)
+
+        self.step_labels.append((keys, times))
+
+    def check_labels(self, received):
+        agents = received // (MAX_CONTENT_ID + 1)
+        # Labels of earlier steps are always earlier. Labels of an earlier
+        # wave of this step can be later than the item.
+        if self.labeled is None:
+            blocked = np.zeros(len(received), dtype=bool)
+        else:
+            blocked = test_bits(self.labeled, received)
+        now = self.schedule.steps + self.activation[agents]
+        for keys, times in self.step_labels:
+            pos, found = find_sorted(keys, received)
+            blocked[found] |= times[pos[found]] <= now[found]
+
+        self.misinfo_blocked += np.bincount(agents[blocked], minlength=self.size)
+        self.misinfo_seen += np.bincount(agents[~blocked], minlength=self.size)
+        return ~blocked
+
+    def collect(self):
+        self.datacollector.collect(self)
+        self.replicate_collector.collect(self)
+
+    def step(self):
+        self.content_ids = self.rng.integers(1, MAX_CONTENT_ID + 1, (self.replicates, CONTENT_PER_STEP))
+
+        self.mod_budget[self.mods] = self.mod_work
+        self._late = []
+
+        received, hops = self.post_misinfo()
+        cascade = self.reshare_probability > 0
+        if cascade and self.received is None:
+            self.received = np.zeros((self.size, ROW_BYTES), dtype=np.uint8)
+        waves = []
+        while len(received):
+            if cascade:
+                set_bits(self.received, received)
+                waves.append(received)
+            self.label_misinfo(received)
+            seen = self.check_labels(received)
+            if not cascade:
+                break
+            received, hops = self.reshare_misinfo(received[seen], hops[seen])
+        for received in waves:
+            clear_bits(self.received, received)
+
+        late_keys, late_hops = zip(*self._late)
+        self.misinfo_pending, self.misinfo_pending_hops = self.first_by_key(np.concatenate(late_keys),
+                                                                            np.concatenate(late_hops))
+        if self.step_labels and self.labeled is None:
+            self.labeled = np.zeros((self.size, ROW_BYTES), dtype=np.uint8)
+        for keys, times in self.step_labels:
+            set_bits(self.labeled, keys)
+        self.step_labels = []
+        self.activation = self.rng.random(self.size)
+
+        self.schedule.step()
+        # collect data
+        self.collect()
+
+    def run_model(self, n):
+        for i in range(n):
+            self.step()
@@ -0,0 +1,166 @@
+import math
+
+import networkx as nx
+import numpy as np
+from mesa.visualization.ModularVisualization import VisualizationElement
+
+
+class NetworkDiffModule(VisualizationElement):
+    """ NetworkModule that sends the graph once and then only what changed.
+
+    The first frame of a model has every node and edge. Later frames only
+    have the nodes whose portrayal differs from the previous frame, which
+    NetworkDiffModule.js patches into the graph it already shows.
+
+    node_portrayal(G) and edge_portrayal(G) return the 'nodes' and 'edges'
+    lists of a NetworkModule portrayal. Paths in local_includes are relative
+    to the directory the server is launched from.
+    """
+    package_includes = ["sigma.min.js"]
+    local_includes = ["agentmodel/js/NetworkDiffModule.js"]
+
+    def __init__(self, node_portrayal, edge_portrayal, canvas_height=500, canvas_width=500):
+        self.node_portrayal = node_portrayal
+        self.edge_portrayal = edge_portrayal
+        self.canvas_height = canvas_height
+        self.canvas_width = canvas_width
+        new_element = ("new NetworkDiffModule({}, {})".
+                       format(self.canvas_width, self.canvas_height))
+        self.js_code = "elements.push(" + new_element + ");"
+
+        self._model = None
+        self._nodes = {}
+
+    def render(self, model):
+        return self._diff_frame(model, model.G)
+
+    def _diff_frame(self, model, G):
+        nodes = self.node_portrayal(G)
+
+        # The server builds a new model on every reset, and the page resets
+        # when it connects, so a new model means the client has no graph yet
+        if model is not self._model:
+            self._model = model
+            self._nodes = {node['id']: node for node in nodes}
+            return self._full_frame(G, nodes)
+
+        changed = [node for node in nodes if self._nodes[node['id']] != node]
+        self._nodes.update((node['id'], node) for node in changed)
+        return {'nodes': changed}
+
+    def _full_frame(self, G, nodes):
+        return {'nodes': nodes, 'edges': self.edge_portrayal(G)}
+
+
+class NetworkLODModule(NetworkDiffModule):
+    """ NetworkDiffModule that bounds what is sent for large graphs.
+
+    Graphs with up to max_nodes nodes are drawn in full. Larger graphs are
+    drawn as a fixed random sample of max_nodes nodes with at most max_edges
+    of the edges between them, laid out once on the server. With
+    aggregate=True they are drawn instead as one node per color, i.e. per
+    role and exposure bucket of compute_color, sized by its number of agents
+    and linked by the number of edges between the buckets.
+
+    The sample, layout and edge array are cached per graph size, so resets
+    with the same parameters reuse them.
+    """
+
+    def __init__(self, node_portrayal, edge_portrayal, canvas_height=500, canvas_width=500,
+                 max_nodes=1000, max_edges=5000, aggregate=False, seed=0):
+        super().__init__(node_portrayal, edge_portrayal, canvas_height, canvas_width)
+        self.max_nodes = max_nodes
+        self.max_edges = max_edges
+        self.aggregate = aggregate
+        self.seed = seed
+
+        self._layout_key = None
+        self._layout = {}
+        self._sample = None
+        self._positions = None
+
+    def render(self, model):
+        G = model.G
+        self._sample = self._positions = None
+        if len(G) <= self.max_nodes:
+            return super().render(model)
+
+        if self.aggregate:
+            return self._aggregate_frame(G)
+
+        self._sample, self._positions = self._sample_layout(G)
+        return self._diff_frame(model, G.subgraph(self._sample))
+
+    def _cached_layout(self, G):
+        key = (len(G), G.number_of_edges())
+        if key != self._layout_key:
+            self._layout_key = key
+            self._layout = {}
+        return self._layout
+
+    def _sample_layout(self, G):
+        """ Sampled graph, thinned to max_edges, and its node positions. """
+        layout = self._cached_layout(G)
+        if 'sample' not in layout:
+            rng = np.random.default_rng(self.seed)
+            nodes = list(G.nodes)
+            picked = np.sort(rng.choice(len(nodes), self.max_nodes, replace=False))
+
+            sample = nx.Graph()
+            sample.add_nodes_from(nodes[i] for i in picked)
+            edges = list(G.subgraph(sample.nodes).edges)
+            if len(edges) > self.max_edges:
+                edges = [edges[i] for i in np.sort(rng.choice(len(edges), self.max_edges, replace=False))]
+            sample.add_edges_from(edges)
+
+            positions = nx.spring_layout(sample, seed=self.seed)
+            layout['sample'] = sample
+            layout['positions'] = {node: (float(x), float(y)) for node, (x, y) in positions.items()}
+        return layout['sample'], layout['positions']
+
+    def _full_frame(self, G, nodes):
+        if self._sample is None:
+            return super()._full_frame(G, nodes)
+
+        # Positions are only sent once, so they are kept out of the nodes
+        # that later frames are compared against
+        nodes = [dict(node, x=self._positions[node['id']][0], y=self._positions[node['id']][1])
+                 for node in nodes]
+        return {'nodes': nodes, 'edges': self.edge_portrayal(self._sample)}
+
+    def _aggregate_frame(self, G):
+        """ One node per color and one edge per pair of colors. """
+        layout = self._cached_layout(G)
+        if 'edges' not in layout:
+            index = {node: i for i, node in enumerate(G.nodes)}
+            layout['edges'] = np.array([(index[u], index[v]) for u, v in G.edges], dtype=np.int64).reshape(-1, 2)
+        edges = layout['edges']
+
+        nodes = self.node_portrayal(G)
+        colors, node_class = np.unique([node['color'] for node in nodes], return_inverse=True)
+        counts = np.bincount(node_class, minlength=len(colors))
+
+        source, target = node_class[edges[:, 0]], node_class[edges[:, 1]]
+        between = source != target
+        pairs = np.minimum(source, target)[between] * len(colors) + np.maximum(source, target)[between]
+        pair_counts = np.bincount(pairs, minlength=len(colors) ** 2)
+
+        frame = {'nodes': [], 'edges': []}
+        for i, color in enumerate(colors):
+            angle = 2 * math.pi * i / len(colors)
+            frame['nodes'].append({'id': str(color),
+                                   'size': int(counts[i]),
+                                   'color': str(color),
+                                   'label': '{} agents'.format(counts[i]),
+                                   'x': math.cos(angle),
+                                   'y': math.sin(angle),
+                                   })
+        for pair in np.flatnonzero(pair_counts):
+            frame['edges'].append({'id': int(pair),
+                                   'source': str(colors[pair // len(colors)]),
+                                   'target': str(colors[pair % len(colors)]),
+                                   'size': int(pair_counts[pair]),
+                                   'color': '#000000',
+                                   'label': '{} edges'.format(pair_counts[pair]),
+                                   })
+        return frame
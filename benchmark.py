@@ -0,0 +1,215 @@
+"""Benchmarks for the models, compared against a stored baseline.
+
+Times construction, step(), datacollector.collect() and run_model() for every
+model over a ladder of sizes and graph densities, and measures the peak
+memory of building and running each one. Results are written as JSON and
+compared against benchmark_baseline.json:
+
+    python benchmark.py                     # run and compare
+    python benchmark.py --update-baseline   # run and store as the new baseline
+
+The Mesa models always use their own graph. The vectorized engines also run
+on Barabasi-Albert graphs of a given attachment count m, passed in as graph=,
+so that density can be varied independently of size. Generated graphs are
+cached on disk and warmed up before timing, so construction times do not
+include graph generation.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from agentmodel.graphs import cached_csr, save_csr
+from agentmodel.model import MisinfoLabelingNetwork
+from agentmodel.vectorized import VectorizedMisinfoNetwork
+import model1.model
+import model1.vectorized
+import model2.model
+import model2.vectorized
+
+
+SEED = 0
+STEPS = 5        # steps timed one by one
+COLLECTS = 5     # datacollector.collect() calls timed one by one
+RUN_STEPS = 20   # steps of the run_model() benchmark
+REPEATS = 3      # construction and run_model() keep the best of this many
+
+# name: (model class, sizes, densities). A density of None keeps the model's
+# own graph; otherwise it is the attachment count m of the graph passed in.
+CASES = {
+    "misinfo": (MisinfoLabelingNetwork, (50, 100, 200, 400), (None,)),
+    "model1": (model1.model.TrollModNetwork, (50, 100, 200, 400), (None,)),
+    "model2": (model2.model.TrollModNetwork, (50, 100, 200, 400), (None,)),
+    "misinfo_vectorized": (VectorizedMisinfoNetwork, (1000, 10000, 100000), (2, 10)),
+    "model1_vectorized": (model1.vectorized.VectorizedTrollModNetwork, (1000, 10000, 100000), (2, 10)),
+    "model2_vectorized": (model2.vectorized.VectorizedTrollModNetwork, (1000, 10000, 100000), (2, 10)),
+}
+
+QUICK_CASES = {name: (model_cls, sizes[:2], densities) for name, (model_cls, sizes, densities) in CASES.items()}
+
+TIMINGS = ("construct_s", "step_s", "collect_s", "run_model_s")
+# Timings this short are mostly noise and are not compared
+TIME_FLOOR = 1e-3
+
+
+def model_kwargs(num_agents, density, graph_dir):
+    if density is None:
+        return {"num_agents": num_agents, "seed": SEED}
+
+    csr_dir = os.path.join(graph_dir, "ba_n{}_m{}".format(num_agents, density))
+    if not os.path.exists(csr_dir):
+        indptr, indices = cached_csr("barabasi_albert", num_agents, density, seed=11)
+        save_csr(csr_dir, indptr, indices)
+    return {"graph": csr_dir, "seed": SEED}
+
+
+def bench_case(model_cls, kwargs):
+    # Warm up the graph cache and imports
+    model_cls(**kwargs)
+
+    construct = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        model = model_cls(**kwargs)
+        construct.append(time.perf_counter() - start)
+
+    step_times = []
+    for _ in range(STEPS):
+        start = time.perf_counter()
+        model.step()
+        step_times.append(time.perf_counter() - start)
+
+    collect_times = []
+    for _ in range(COLLECTS):
+        start = time.perf_counter()
+        model.datacollector.collect(model)
+        collect_times.append(time.perf_counter() - start)
+
+    run = []
+    for _ in range(REPEATS):
+        model = model_cls(**kwargs)
+        start = time.perf_counter()
+        model.run_model(RUN_STEPS)
+        run.append(time.perf_counter() - start)
+    del model
+
+    # Memory is measured in a separate pass, since tracing slows everything down
+    tracemalloc.start()
+    model = model_cls(**kwargs)
+    model.run_model(RUN_STEPS)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {"construct_s": min(construct),
+            "step_s": float(np.median(step_times)),
+            "collect_s": float(np.median(collect_times)),
+            "run_model_s": min(run),
+            "peak_mb": peak / 2**20}
+
+
+def run_benchmarks(cases):
+    results = []
+    with tempfile.TemporaryDirectory() as graph_dir:
+        for name, (model_cls, sizes, densities) in cases.items():
+            for density in densities:
+                for num_agents in sizes:
+                    result = {"case": name, "num_agents": num_agents, "density": density}
+                    result.update(bench_case(model_cls, model_kwargs(num_agents, density, graph_dir)))
+                    print("{case:20} n={num_agents:<7} m={density!s:<5} construct {construct_s:8.4f}s  "
+                          "step {step_s:8.4f}s  collect {collect_s:8.4f}s  run {run_model_s:8.4f}s  "
+                          "peak {peak_mb:8.1f}MB".format(**result))
+                    results.append(result)
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"commit": commit,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "steps": STEPS,
+            "collects": COLLECTS,
+            "run_steps": RUN_STEPS,
+            "repeats": REPEATS,
+            "seed": SEED}
+
+
+def compare(results, baseline, time_tolerance, memory_tolerance):
+    """ Results slower or bigger than the baseline by more than the tolerances. """
+    def key(result):
+        return result["case"], result["num_agents"], result["density"]
+
+    stored = {key(result): result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        base = stored.get(key(result))
+        if base is None:
+            continue
+        checks = [(name, time_tolerance, TIME_FLOOR) for name in TIMINGS] + [("peak_mb", memory_tolerance, 0)]
+        for name, tolerance, floor in checks:
+            if max(base[name], result[name]) > floor and result[name] > base[name] * (1 + tolerance):
+                regressions.append(key(result) + (name, base[name], result[name]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the models against a stored baseline.")
+    parser.add_argument("--output", default="benchmark_results.json",
+                        help="where to write the results")
+    parser.add_argument("--baseline", default="benchmark_baseline.json",
+                        help="stored results to compare against")
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="store the results as the new baseline instead of comparing")
+    parser.add_argument("--quick", action="store_true",
+                        help="only run the two smallest sizes of every case")
+    parser.add_argument("--cases", nargs="+", choices=sorted(CASES),
+                        help="only run these cases")
+    parser.add_argument("--time-tolerance", type=float, default=0.25,
+                        help="allowed slowdown as a fraction of the baseline")
+    parser.add_argument("--memory-tolerance", type=float, default=0.10,
+                        help="allowed peak memory growth as a fraction of the baseline")
+    args = parser.parse_args(argv)
+
+    cases = QUICK_CASES if args.quick else CASES
+    if args.cases:
+        cases = {name: cases[name] for name in args.cases}
+
+    report = {"environment": environment(), "results": run_benchmarks(cases)}
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print("Stored baseline in {}".format(args.baseline))
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("No baseline at {}, nothing to compare".format(args.baseline))
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(report["results"], baseline, args.time_tolerance, args.memory_tolerance)
+    for case, num_agents, density, name, before, after in regressions:
+        print("REGRESSION {} n={} m={} {}: {:.4g} -> {:.4g} ({:+.0%})".format(
+            case, num_agents, density, name, before, after, after / before - 1))
+    if not regressions:
+        print("No regressions against {}".format(args.baseline))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,5 +1,8 @@
   
-from mesa.batchrunner import BatchRunner
+import sys
+
+from agentmodel.search import AdaptiveSweepRunner
+from agentmodel.sweep import SweepRunner
 from model1.model import *
 from mesa.datacollection import DataCollector
 import pandas as pd
@@ -13,18 +16,38 @@ variable_params = {'percent_trolls': np.arange(0.0, 0.5, 0.02),
                    'percent_mods': np.arange(0.0, 0.5, 0.02),
                    }
 
-batch_run = BatchRunner(TrollModNetwork,
+batch_run = SweepRunner(TrollModNetwork,
                         variable_params,
                         fixed_params,
                         iterations=3,
                         max_steps=20,
+                        results_path='sweep_model1.jsonl',
+                        cache_dir='sweep_cache',
                         model_reporters={"average_trolling": compute_avg_delta})
 
+# Same sweep from a Latin hypercube design, refined where the outcome
+# changes sharply; about a third of the runs of the full grid
+adaptive_run = AdaptiveSweepRunner(TrollModNetwork,
+                                   {'percent_trolls': (0.0, 0.48),
+                                    'percent_mods': (0.0, 0.48)},
+                                   "average_trolling",
+                                   fixed_params,
+                                   iterations=3,
+                                   max_steps=20,
+                                   initial_samples=80,
+                                   refine_rounds=4,
+                                   refine_samples=30,
+                                   results_path='sweep_model1_adaptive.jsonl',
+                                   cache_dir='sweep_cache',
+                                   model_reporters={"average_trolling": compute_avg_delta})
+
 
 if __name__ == '__main__':
     
-    batch_run.run_all()
-    run_data = batch_run.get_model_vars_dataframe()
+    # "adaptive" as the first argument runs adaptive_run instead of the grid
+    runner = adaptive_run if sys.argv[1:2] == ['adaptive'] else batch_run
+    runner.run_all()
+    run_data = runner.get_model_vars_dataframe()
     plt.scatter(run_data.percent_trolls, run_data.percent_mods, c=run_data.average_trolling, cmap='nipy_spectral')
     plt.clim(0,3.5)
     cbar = plt.colorbar()
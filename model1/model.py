@@ -1,34 +1,57 @@
 from mesa import Agent, Model
 from mesa.time import RandomActivation
-from mesa.datacollection import DataCollector
-import networkx as nx
 import numpy as np
 import math
 
-from mesa.space import NetworkGrid
+from agentmodel.activation import ActiveSetActivation
+from agentmodel.checkpoint import write_checkpoint, read_checkpoint, restore_checkpoint
+from agentmodel.datacollection import ColumnarDataCollector
+from agentmodel.profiling import PhaseProfiler
+from agentmodel.snapshots import SnapshotRing
+from agentmodel.space import CachedNetworkGrid
+from agentmodel.steadystate import SteadyStateDetector
 
 
 def compute_avg_delta(model):
-    df = model.datacollector.get_model_vars_dataframe()
-    return df['Average Delta Trolling'].mean()
-    
+    # Mean of "Average Delta Trolling" over all collected steps
+    return model.avg_troll_delta
 
 
 def compute_troll_delta(model):
-    # Trolling delta over the last 5 steps
-    trolling_received_per_agent = []
-    for agent in model.schedule.agents:
-        if len(agent.trolling_snapshot) > 0:
-            trolling_received_per_agent.append(float(agent.trolling_snapshot[0] - agent.trolling_snapshot[-1])/float(len(agent.trolling_snapshot)))
-        else:
-            trolling_received_per_agent.append(0)
-    
-    return np.average(trolling_received_per_agent)
+    # Trolling delta over the last snapshot_window steps
+    return np.average(model.trolling_snapshot.average_deltas())
+
 
 class TrollModNetwork(Model):
-    """A model with some number of trolls, mods, and regular users."""
+    """A model with some number of trolls, mods, and regular users.
+
+    With profile=True, time spent in each phase of a step is recorded in
+    self.profiler (see PhaseProfiler); otherwise self.profiler is None.
+
+    save_checkpoint() / load_checkpoint() save a running model and restore
+    it so that it continues exactly as it would have without interruption.
+
+    If steady_window is set, the model stops running once "Average Delta
+    Trolling" changes by at most steady_tolerance over that many steps.
 
-    def __init__(self, num_agents=50, percent_trolls=.10, percent_mods=.20):
+    With active_set=True agents are stepped by ActiveSetActivation, which
+    skips agents that are neither trolls nor mods and have no troll
+    neighbors. Runs then differ from RandomActivation ones, but agree with
+    them in distribution.
+    """
+
+    def __init__(self, num_agents=50, percent_trolls=.10, percent_mods=.20,
+                 snapshot_window=5, steady_window=None, steady_tolerance=1e-3, active_set=False,
+                 data_dir=None, profile=False, seed=None):
+
+        # Constructor arguments that define the model, kept for checkpoints
+        self.params = {"num_agents": num_agents,
+                       "percent_trolls": percent_trolls,
+                       "percent_mods": percent_mods,
+                       "snapshot_window": snapshot_window,
+                       "steady_window": steady_window,
+                       "steady_tolerance": steady_tolerance,
+                       "active_set": active_set}
 
         self.num_agents = num_agents
         self.num_nodes = num_agents
@@ -37,19 +60,28 @@ class TrollModNetwork(Model):
         self.num_regular = self.num_agents - (self.num_trolls + self.num_mods)
         
         
-#         self.G = nx.barabasi_albert_graph(self.num_nodes, int(round(float(self.num_nodes)*0.90)), seed=11)
-#         self.G = nx.barabasi_albert_graph(self.num_nodes, int(round(float(self.num_nodes)*0.10)), seed=11)
-        self.G = nx.powerlaw_cluster_graph(self.num_nodes, int(round(float(self.num_nodes)*0.1)), p=0.9, seed=11)
-        self.grid = NetworkGrid(self.G)
-        self.schedule = RandomActivation(self)
+#         self.grid = CachedNetworkGrid.generated("barabasi_albert", self.num_nodes, int(round(float(self.num_nodes)*0.90)), seed=11)
+#         self.grid = CachedNetworkGrid.generated("barabasi_albert", self.num_nodes, int(round(float(self.num_nodes)*0.10)), seed=11)
+        self.grid = CachedNetworkGrid.generated("powerlaw_cluster", self.num_nodes, int(round(float(self.num_nodes)*0.1)), p=0.9, seed=11)
+        self.active_set = active_set
+        self.schedule = ActiveSetActivation(self) if active_set else RandomActivation(self)
         self.running = True
+        # trolling_received of every agent over the last snapshot_window steps
+        self.trolling_snapshot = SnapshotRing(self.num_agents, snapshot_window)
+        self.avg_troll_delta = 0.0
+        self.num_collected = 0
         
-        self.datacollector = DataCollector(
+        # Agent reporters are stored as arrays, written under data_dir if given
+        self.datacollector = ColumnarDataCollector(
             model_reporters={"Average Delta Trolling": compute_troll_delta},
-            agent_reporters={"Trolling Delta": lambda _: _.trolling_received_snapshot}
+            agent_reporters={"Trolling Delta": "trolling_received_snapshot"},
+            data_dir=data_dir
         )
+        self.steady_state = None
+        if steady_window is not None:
+            self.steady_state = SteadyStateDetector(["Average Delta Trolling"], steady_window, steady_tolerance)
 
-        list_of_random_nodes = self.random.sample(self.G.nodes(), self.num_agents)
+        list_of_random_nodes = self.random.sample(range(self.num_nodes), self.num_agents)
 
         # Create agents
         for i in range(self.num_trolls):
@@ -70,18 +102,74 @@ class TrollModNetwork(Model):
             # Add the agent to a random node
             self.grid.place_agent(a, list_of_random_nodes[i])
 
+        if active_set:
+            # Only trolls raise trolling_received, so agents that neither have
+            # a role nor a troll next to them stay at zero and are skipped
+            for a in self.schedule.agents:
+                if a.is_troll or a.is_mod or any(n.is_troll for n in self.grid.get_neighbor_agents(a.pos)):
+                    self.schedule.activate(a)
+
         self.running = True
+        self.collect()
+
+        self.profiler = None
+        if profile:
+            self.profiler = PhaseProfiler()
+            self.profiler.wrap(self, "step", "model step")
+            self.profiler.wrap(self.grid, "get_neighbor_agents", "neighbor lookup")
+            self.profiler.wrap(self, "collect", "collect")
+            for agent in self.schedule.agents:
+                self.profiler.wrap(agent, "step", "step " + type(agent).__name__)
+
+    @property
+    def G(self):
+        # The networkx graph is only built for the server
+        return self.grid.G
+
+    def collect(self):
         self.datacollector.collect(self)
+        # Running mean for compute_avg_delta
+        self.num_collected += 1
+        delta = self.datacollector.model_vars["Average Delta Trolling"][-1]
+        self.avg_troll_delta += (delta - self.avg_troll_delta) / self.num_collected
 
     def step(self):
         self.schedule.step()
         # collect data
-        self.datacollector.collect(self)
+        self.collect()
+        if self.steady_state is not None:
+            self.steady_state.check(self)
 
     def run_model(self, n):
         for i in range(n):
+            if not self.running:
+                break
             self.step()
 
+    def save_checkpoint(self, path):
+        """ Save the model to path, a .npz file. """
+        arrays = {"trolling_received": np.array([a.trolling_received for a in self.schedule.agents], dtype=np.int64),
+                  "snapshot_values": self.trolling_snapshot.values,
+                  "snapshot_counts": self.trolling_snapshot.counts}
+        state = {"avg_troll_delta": self.avg_troll_delta,
+                 "num_collected": self.num_collected}
+        write_checkpoint(path, self, state, arrays)
+
+    @classmethod
+    def load_checkpoint(cls, path, data_dir=None, profile=False):
+        """ Rebuild a model saved with save_checkpoint(), ready to keep stepping. """
+        header, arrays = read_checkpoint(path)
+        model = cls(data_dir=data_dir, profile=profile, seed=header["seed"], **header["params"])
+        restore_checkpoint(model, header, arrays)
+        model.avg_troll_delta = header["state"]["avg_troll_delta"]
+        model.num_collected = header["state"]["num_collected"]
+
+        for agent, received in zip(model.schedule.agents, arrays["trolling_received"].tolist()):
+            agent.trolling_received = received
+        model.trolling_snapshot.values[...] = arrays["snapshot_values"]
+        model.trolling_snapshot.counts[...] = arrays["snapshot_counts"]
+        return model
+
 
 
 class RegularUser(Agent):
@@ -90,17 +178,16 @@ class RegularUser(Agent):
     def __init__(self, unique_id, model):
         super().__init__(unique_id, model)
         self.trolling_received = 0
-        self.trolling_received_snapshot = 0
         self.is_mod = False
         self.is_troll = False
-        
-        self.trolling_snapshot = []
+
+    @property
+    def trolling_received_snapshot(self):
+        # Trolling received over the model's snapshot window
+        return self.model.trolling_snapshot.delta(self.unique_id)
 
     def step(self):
-        self.trolling_snapshot.insert(0,self.trolling_received)
-        if len(self.trolling_snapshot) > 5:
-            self.trolling_snapshot = self.trolling_snapshot[0:5]
-        self.trolling_received_snapshot = self.trolling_snapshot[0] - self.trolling_snapshot[-1]
+        self.model.trolling_snapshot.record(self.unique_id, self.trolling_received)
 
 
 class TrollUser(RegularUser):
@@ -111,8 +198,7 @@ class TrollUser(RegularUser):
         self.is_troll = True
 
     def send_trolling(self):
-        neighbors_nodes = self.model.grid.get_neighbors(self.pos, include_center=False)
-        neighbors = self.model.grid.get_cell_list_contents(neighbors_nodes)
+        neighbors = self.model.grid.get_neighbor_agents(self.pos)
         for neighbor in neighbors:
             neighbor.trolling_received += 1
 
@@ -129,8 +215,7 @@ class ModUser(RegularUser):
         self.is_mod = True
 
     def block_trolling(self):
-        neighbors_nodes = self.model.grid.get_neighbors(self.pos, include_center=False)
-        neighbors = self.model.grid.get_cell_list_contents(neighbors_nodes)
+        neighbors = self.model.grid.get_neighbor_agents(self.pos)
         for neighbor in neighbors:
             if neighbor.trolling_received > 0:
                 neighbor.trolling_received -= 1
@@ -0,0 +1,142 @@
+from mesa import Model
+from mesa.time import BaseScheduler
+from mesa.datacollection import DataCollector
+import numpy as np
+import math
+
+from agentmodel.graphs import cached_csr, load_csr, permute_csr, gather_replicated
+from agentmodel.profiling import PhaseProfiler
+from agentmodel.replicates import ReplicateCollector, place_roles
+from agentmodel.snapshots import SnapshotRing
+
+
+def compute_avg_delta(model):
+    # Mean of "Average Delta Trolling" over all collected steps
+    return model.avg_troll_delta
+
+
+def compute_troll_delta(model):
+    # Trolling delta over the last snapshot_window steps
+    return np.average(model.trolling_snapshot.average_deltas())
+
+
+def compute_troll_delta_replicates(model):
+    # compute_troll_delta() for each replicate
+    return model.trolling_snapshot.average_deltas().reshape(model.replicates, -1).mean(axis=1)
+
+
+class VectorizedTrollModNetwork(Model):
+    """Array version of TrollModNetwork.
+
+    Trolling received, roles and the snapshot window are NumPy arrays indexed
+    by agent, and a tick is two vector operations: trolls add one to every
+    neighbor, and each agent then loses one per neighboring mod (plus one if
+    it is a mod itself), never going below zero. Agents act synchronously,
+    trolls before mods, instead of in random order.
+
+    graph can name a directory written by agentmodel.graphs.convert_edgelist()
+    to run on a real network instead of the generated one. It is
+    memory-mapped as is, with one agent per node, so num_agents is taken from
+    the graph.
+
+    replicates > 1 runs that many replicates of the model together on the
+    same graph. Per-agent arrays then hold all replicates back to back
+    (agent r * num_agents + i is agent i of replicate r), each replicate gets
+    its own random role placement, and model reporters are computed over all
+    replicates. replicate_collector keeps "Average Delta Trolling" per
+    replicate.
+
+    With profile=True, time spent in each phase of a step is recorded in
+    self.profiler (see PhaseProfiler); otherwise self.profiler is None.
+    """
+
+    def __init__(self, num_agents=50, percent_trolls=.10, percent_mods=.20,
+                 snapshot_window=5, graph=None, replicates=1, profile=False, seed=None):
+
+        if graph is None:
+            indptr, indices = cached_csr("powerlaw_cluster", num_agents, int(round(float(num_agents)*0.1)), p=0.9, seed=11)
+        else:
+            indptr, indices = load_csr(graph)
+            num_agents = len(indptr) - 1
+
+        self.num_agents = num_agents
+        self.num_nodes = num_agents
+        self.num_trolls = int(math.floor(float(num_agents) * percent_trolls))
+        self.num_mods = int(math.floor(float(num_agents) * percent_mods))
+        self.num_regular = self.num_agents - (self.num_trolls + self.num_mods)
+        self.replicates = replicates
+        self.size = size = replicates * num_agents
+
+        self.schedule = BaseScheduler(self)
+
+        # Replicates share the graph, so they get the placement of a loaded
+        # graph below
+        if graph is None and replicates == 1:
+            # Agents are placed on nodes the same way as TrollModNetwork, and the
+            # adjacency is relabeled from node ids to agent ids
+            list_of_random_nodes = self.random.sample(range(self.num_nodes), self.num_agents)
+            indptr, indices = permute_csr(indptr, indices, list_of_random_nodes)
+        self.rng = np.random.default_rng(self.random.getrandbits(64))
+
+        # Roles follow agent ids: trolls first, then mods, then regular users.
+        # Agents on a loaded graph keep their node ids, so the roles are
+        # shuffled instead.
+        roles = place_roles(self.rng, num_agents, replicates, shuffle=graph is not None or replicates > 1)
+        self.trolls = roles[:, :self.num_trolls].ravel()
+        self.mods = roles[:, self.num_trolls:self.num_trolls + self.num_mods].ravel()
+        self.is_mod = np.zeros(size, dtype=np.int64)
+        self.is_mod[self.mods] = 1
+
+        # Roles never change, so the trolls and mods around every agent are
+        # counted once from the CSR rows of the trolls and mods
+        self.trolls_around = np.bincount(gather_replicated(indptr, indices, self.trolls)[0],
+                                         minlength=size)
+        self.mods_around = np.bincount(gather_replicated(indptr, indices, self.mods)[0],
+                                       minlength=size) + self.is_mod
+
+        self.trolling_received = np.zeros(size, dtype=np.int64)
+        # trolling_received of every agent over the last snapshot_window steps
+        self.trolling_snapshot = SnapshotRing(size, snapshot_window)
+
+        self.avg_troll_delta = 0.0
+        self.num_collected = 0
+        self.datacollector = DataCollector(
+            model_reporters={"Average Delta Trolling": compute_troll_delta}
+        )
+        self.replicate_collector = ReplicateCollector(
+            model_reporters={"Average Delta Trolling": compute_troll_delta_replicates}
+        )
+
+        self.running = True
+        self.collect()
+
+        self.profiler = None
+        if profile:
+            self.profiler = PhaseProfiler()
+            self.profiler.wrap(self, "step", "model step")
+            self.profiler.wrap(self, "collect", "collect")
+
+    @property
+    def trolling_received_snapshot(self):
+        return self.trolling_snapshot.deltas()
+
+    def collect(self):
+        self.datacollector.collect(self)
+        self.replicate_collector.collect(self)
+        # Running mean for compute_avg_delta
+        self.num_collected += 1
+        delta = self.datacollector.model_vars["Average Delta Trolling"][-1]
+        self.avg_troll_delta += (delta - self.avg_troll_delta) / self.num_collected
+
+    def step(self):
+        self.trolling_received += self.trolls_around
+        self.trolling_received = np.maximum(self.trolling_received - self.mods_around, 0)
+        self.trolling_snapshot.record_all(self.trolling_received)
+
+        self.schedule.step()
+        # collect data
+        self.collect()
+
+    def run_model(self, n):
+        for i in range(n):
+            self.step()
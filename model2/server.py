@@ -1,7 +1,7 @@
 from mesa.visualization.ModularVisualization import ModularServer
 from mesa.visualization.UserParam import UserSettableParameter
 from mesa.visualization.modules import ChartModule
-from mesa.visualization.modules import NetworkModule
+from agentmodel.visualization import NetworkLODModule
 from .model import TrollModNetwork
 
 
@@ -18,29 +18,37 @@ def compute_color(agent):
         return "#FFA500" # orange
 
 
-def network_portrayal(G):
+def node_portrayal(G):
     # The model ensures there is 0 or 1 agent per node
+    return [{'id': node_id,
+             'size': 2,
+             'color': compute_color(agents[0]),
+             'label': None if not agents else 'Agent:{} Trolling Delta:{} Total: {}'.format(agents[0].unique_id,
+                                                                          agents[0].trolling_received_snapshot, agents[0].trolling_received),
+             }
+            for (node_id, agents) in G.nodes.data('agent')]
 
-    portrayal = dict()
-    portrayal['nodes'] = [{'id': node_id,
-                           'size': 2,
-                           'color': compute_color(agents[0]),
-                           'label': None if not agents else 'Agent:{} Trolling Delta:{} Total: {}'.format(agents[0].unique_id,
-                                                                                        agents[0].trolling_received_snapshot, agents[0].trolling_received),
-                           }
-                          for (node_id, agents) in G.nodes.data('agent')]
-
-    portrayal['edges'] = [{'id': edge_id,
-                           'source': source,
-                           'target': target,
-                           'color': '#000000',
-                           }
-                          for edge_id, (source, target) in enumerate(G.edges)]
 
+def edge_portrayal(G):
+    return [{'id': edge_id,
+             'source': source,
+             'target': target,
+             'color': '#000000',
+             }
+            for edge_id, (source, target) in enumerate(G.edges)]
+
+
+def network_portrayal(G):
+    portrayal = dict()
+    portrayal['nodes'] = node_portrayal(G)
+    portrayal['edges'] = edge_portrayal(G)
     return portrayal
 
 
-grid = NetworkModule(network_portrayal, 500, 500, library='sigma')
+# Edges never change, so after the first frame only changed nodes are sent.
+# Graphs above max_nodes (num_agents goes up to 10000) are drawn as a sample
+# with a precomputed layout
+grid = NetworkLODModule(node_portrayal, edge_portrayal, 500, 500, max_nodes=1000)
 chart = ChartModule([
     {"Label": "Average Delta Trolling", "Color": "Black"}],
     data_collector_name='datacollector'
@@ -48,7 +56,7 @@ chart = ChartModule([
 
 
 model_params = {
-    "num_agents": UserSettableParameter('slider', "Number of agents", 30, 0, 100, 10,
+    "num_agents": UserSettableParameter('slider', "Number of agents", 30, 10, 10000, 10,
                                         description="Choose how many total agents to include in the model"),
     "percent_trolls": UserSettableParameter('slider', "Percent trolls", .1, 0, 1.0, 0.05,
                                        description="Choose what percent trolls to include in the model"),
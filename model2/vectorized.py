@@ -0,0 +1,182 @@
+from mesa import Model
+from mesa.time import BaseScheduler
+from mesa.datacollection import DataCollector
+import numpy as np
+import math
+
+from agentmodel.graphs import cached_csr, load_csr, permute_csr, gather_replicated
+from agentmodel.profiling import PhaseProfiler
+from agentmodel.replicates import ReplicateCollector, place_roles
+from agentmodel.snapshots import SnapshotRing
+
+
+def compute_avg_delta(model):
+    # Mean of "Average Delta Trolling" over all collected steps
+    return model.avg_troll_delta
+
+
+def compute_troll_delta(model):
+    # Trolling delta over the last snapshot_window steps
+    return np.average(model.trolling_snapshot.average_deltas())
+
+
+def compute_troll_delta_replicates(model):
+    # compute_troll_delta() for each replicate
+    return model.trolling_snapshot.average_deltas().reshape(model.replicates, -1).mean(axis=1)
+
+
+def cumsum_before(values, groups):
+    """ Sum of the earlier values in the same group, for sorted groups. """
+    totals = np.cumsum(values) - values
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    counts = np.diff(np.r_[starts, len(groups)])
+    return totals - np.repeat(totals[starts], counts)
+
+
+class VectorizedTrollModNetwork(Model):
+    """Array version of TrollModNetwork.
+
+    Trolling received, roles and the snapshot window are NumPy arrays indexed
+    by agent. Trolls add one to every neighbor, then mods spend mod_power on
+    themselves and on their neighbors in random order. Mods act together in
+    rounds: each mod offers its remaining budget to its neighbors in a random
+    order, each neighbor takes offers in a random order until it is cleared,
+    and unspent budget is offered again in the next round. Agents act synchronously, trolls before
+    mods, instead of in random order.
+
+    graph can name a directory written by agentmodel.graphs.convert_edgelist()
+    to run on a real network instead of the generated one. It is
+    memory-mapped as is, with one agent per node, so num_agents is taken from
+    the graph.
+
+    replicates > 1 runs that many replicates of the model together on the
+    same graph. Per-agent arrays then hold all replicates back to back
+    (agent r * num_agents + i is agent i of replicate r), each replicate gets
+    its own random role placement, and model reporters are computed over all
+    replicates. replicate_collector keeps "Average Delta Trolling" per
+    replicate.
+
+    With profile=True, time spent in each phase of a step is recorded in
+    self.profiler (see PhaseProfiler); otherwise self.profiler is None.
+    """
+
+    def __init__(self, num_agents=30, percent_trolls=.10, percent_mods=.20, mod_power=10,
+                 snapshot_window=5, graph=None, replicates=1, profile=False, seed=None):
+
+        if graph is None:
+            indptr, indices = cached_csr("barabasi_albert", num_agents, int(round(float(num_agents)*0.90)), seed=11)
+        else:
+            indptr, indices = load_csr(graph)
+            num_agents = len(indptr) - 1
+
+        self.num_agents = num_agents
+        self.num_nodes = num_agents
+        self.num_trolls = int(math.floor(float(num_agents) * percent_trolls))
+        self.num_mods = int(math.floor(float(num_agents) * percent_mods))
+        self.num_regular = self.num_agents - (self.num_trolls + self.num_mods)
+        self.mod_power = mod_power
+        self.replicates = replicates
+        self.size = size = replicates * num_agents
+
+        self.schedule = BaseScheduler(self)
+
+        # Replicates share the graph, so they get the placement of a loaded
+        # graph below
+        if graph is None and replicates == 1:
+            # Agents are placed on nodes the same way as TrollModNetwork, and the
+            # adjacency is relabeled from node ids to agent ids
+            list_of_random_nodes = self.random.sample(range(self.num_nodes), self.num_agents)
+            indptr, indices = permute_csr(indptr, indices, list_of_random_nodes)
+        self.indptr, self.indices = indptr, indices
+        self.rng = np.random.default_rng(self.random.getrandbits(64))
+
+        # Roles follow agent ids: trolls first, then mods, then regular users.
+        # Agents on a loaded graph keep their node ids, so the roles are
+        # shuffled instead.
+        roles = place_roles(self.rng, num_agents, replicates, shuffle=graph is not None or replicates > 1)
+        self.trolls = roles[:, :self.num_trolls].ravel()
+        self.mods = roles[:, self.num_trolls:self.num_trolls + self.num_mods].ravel()
+        self.is_mod = np.zeros(size, dtype=np.int64)
+        self.is_mod[self.mods] = 1
+        # Roles never change, so the trolls around every agent are counted once
+        self.trolls_around = np.bincount(gather_replicated(self.indptr, self.indices, self.trolls)[0],
+                                         minlength=size)
+        # Every (mod, neighbor) pair, as neighbor ids and positions in self.mods
+        self.mod_neighbors, self.mod_edges = gather_replicated(self.indptr, self.indices, self.mods)
+
+        self.trolling_received = np.zeros(size, dtype=np.int64)
+        # trolling_received of every agent over the last snapshot_window steps
+        self.trolling_snapshot = SnapshotRing(size, snapshot_window)
+
+        self.avg_troll_delta = 0.0
+        self.num_collected = 0
+        self.datacollector = DataCollector(
+            model_reporters={"Average Delta Trolling": compute_troll_delta}
+        )
+        self.replicate_collector = ReplicateCollector(
+            model_reporters={"Average Delta Trolling": compute_troll_delta_replicates}
+        )
+
+        self.running = True
+        self.collect()
+
+        self.profiler = None
+        if profile:
+            self.profiler = PhaseProfiler()
+            self.profiler.wrap(self, "step", "model step")
+            self.profiler.wrap(self, "block_trolling", "mod blocking")
+            self.profiler.wrap(self, "collect", "collect")
+
+    @property
+    def trolling_received_snapshot(self):
+        return self.trolling_snapshot.deltas()
+
+    def block_trolling(self):
+        received = self.trolling_received
+
+        # Mods clear their own trolling first
+        budget = np.full(len(self.mods), self.mod_power, dtype=np.int64)
+        own = np.minimum(budget, received[self.mods])
+        received[self.mods] -= own
+        budget -= own
+
+        while True:
+            active = (budget[self.mod_edges] > 0) & (received[self.mod_neighbors] > 0)
+            if not active.any():
+                break
+            neighbors, mods = self.mod_neighbors[active], self.mod_edges[active]
+
+            # Each mod offers its budget to its neighbors in random order
+            order = np.lexsort((self.rng.random(len(mods)), mods))
+            neighbors, mods = neighbors[order], mods[order]
+            demand = received[neighbors]
+            offer = np.clip(budget[mods] - cumsum_before(demand, mods), 0, demand)
+
+            # A neighbor of several mods takes their offers in random order
+            order = np.lexsort((self.rng.random(len(neighbors)), neighbors))
+            neighbors, mods, offer = neighbors[order], mods[order], offer[order]
+            taken = np.clip(received[neighbors] - cumsum_before(offer, neighbors), 0, offer)
+
+            received -= np.bincount(neighbors, weights=taken, minlength=len(received)).astype(np.int64)
+            budget -= np.bincount(mods, weights=taken, minlength=len(budget)).astype(np.int64)
+
+    def collect(self):
+        self.datacollector.collect(self)
+        self.replicate_collector.collect(self)
+        # Running mean for compute_avg_delta
+        self.num_collected += 1
+        delta = self.datacollector.model_vars["Average Delta Trolling"][-1]
+        self.avg_troll_delta += (delta - self.avg_troll_delta) / self.num_collected
+
+    def step(self):
+        self.trolling_received += self.trolls_around
+        self.block_trolling()
+        self.trolling_snapshot.record_all(self.trolling_received)
+
+        self.schedule.step()
+        # collect data
+        self.collect()
+
+    def run_model(self, n):
+        for i in range(n):
+            self.step()